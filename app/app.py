@@ -3,6 +3,11 @@ The application itself
 """
 import dash
 import dash_bootstrap_components as dbc
+from flask_caching import Cache
+
+from config import ConfigFactory
+
+conf = ConfigFactory.factory()
 
 
 app = dash.Dash(
@@ -16,3 +21,6 @@ app = dash.Dash(
     suppress_callback_exceptions=True,
 )
 server = app.server
+
+# shared between worker processes unless CACHE_TYPE is SimpleCache
+flask_cache = Cache(server, config=conf.CACHE_CONFIG)
@@ -2,112 +2,159 @@
 Display local COVID information
 """
 import arrow
-import datetime
+import functools
 import dash_bootstrap_components as dbc
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 import requests
-from config import header, nav
-from dash import Dash, Input, Output, State
+from cache import shared_backend
+from config import ConfigFactory, header, nav
+from dash import Dash, Input, Output, Patch, State
 from dash import dash_table as dt
 from dash import dcc, html
-from wrangle_govuk import CASES_BY_AGE, HOSP_CASES
+from dash.exceptions import PreventUpdate
+import utils
+import wrangle_govuk as wgu
 
 from app import app
 
+conf = ConfigFactory.factory()
 
-@app.callback(Output("cases-popn-age2d", "figure"), Input("cases-popn", "data"))
-def cases_popn_age(data):
-    df = pd.DataFrame.from_records(data)
-    df['date'] = pd.to_datetime(df['date'])
-
-    age_bands = df.age.unique().tolist()
-    age_bands = list(set(age_bands) - set(["60+", "00_59", "unassigned"]))
-    dff = df.loc[df.age.isin(age_bands) & (df.date > datetime.datetime.utcnow() - datetime.timedelta(days=365+31))]
-
-    fig = px.density_heatmap(
-        dff,
-        x="date",
-        y="age",
-        z="cases",
-        histfunc="sum",
-        nbinsx=365+31,
-        color_continuous_scale="Hot",
+# gov.uk is polled off the request path; the page reads the local store
+if conf.GOV_UK_INGEST:
+    wgu.start_ingestion(
+        conf.GOV_UK_ENGINE,
+        interval=conf.GOV_UK_INTERVAL,
+        lock_path=conf.GOV_UK_LOCK if shared_backend() else None,
     )
-    return fig
-
 
-@app.callback(Output("cases-popn-age", "figure"), Input("cases-popn", "data"))
-def cases_popn_age(data):
-    df = pd.DataFrame.from_records(data)
-    age_bands = df.age.unique().tolist()
-    age_bands = list(set(age_bands) - set(["60+", "00_59", "unassigned"]))
-    fig = go.Figure()
 
-    for age in age_bands:
-        _df = df.loc[df.age == age]
-        fig.add_trace(
-            go.Scatter(
+@functools.lru_cache(maxsize=2)
+def hosp_figures(release, since) -> tuple:
+    """NCL trusts and London sectors; built once per release"""
+    series = wgu.hosp_series(release, since)
+    figs = []
+    for wide in (series["ncl"], series["london"]):
+        fig = go.Figure()
+        for name in wide.columns:
+            fig.add_trace(
+                go.Scatter(
+                    name=name,
+                    x=wide.index,
+                    y=wide[name],
+                )
+            )
+        figs.append(fig)
+    return tuple(figs)
+
+
+def decimate(s: pd.Series, start=None, end=None, n: int = None):
+    """
+    The points of the series between start and end (dates; None for open)
+    cut down to n with LTTB so that the browser draws no more than it can show
+    """
+    s = s.loc[start:end]
+    idx = utils.lttb(s.index.asi8, s.to_numpy(), n or conf.COVID_MAX_POINTS)
+    return s.index[idx], s.iloc[idx].to_numpy()
+
+
+@functools.lru_cache(maxsize=2)
+def popn_figures(release, since) -> tuple:
+    """
+    Cases by age band as (WebGL) lines decimated to COVID_MAX_POINTS
+    and as a heatmap of the date by age matrix; built once per release
+    """
+    wide = wgu.cases_by_age_series(release, since)
+    fig_lines = go.Figure()
+    for age in wide.columns:
+        x, y = decimate(wide[age])
+        fig_lines.add_trace(
+            go.Scattergl(
                 name=age,
-                x=_df.date,
-                y=_df.cases,
+                x=x,
+                y=y,
             )
         )
-    return fig
-
-
-@app.callback(Output("cases-hosp-ncl", "figure"), Input("cases-hosp", "data"))
-def cases_hosp_ncl(data):
-    df = pd.DataFrame.from_records(data)
-    df = df[df.inNCL01]
-    trusts = df.areaCode.unique().tolist()
-    fig = go.Figure()
-
-    for trust in trusts:
-        _df = df.loc[df.areaCode == trust]
-        fig.add_trace(
-            go.Scatter(
-                name=_df.iloc[0].shortName,
-                x=_df.date,
-                y=_df.hospitalCases,
-            )
+    # keep the zoom when the traces are swapped for the zoomed in points
+    fig_lines.update_layout(uirevision="cases-popn-age")
+
+    # one cell per day and age band; binned here not in the browser
+    days = pd.date_range(wide.index.min(), wide.index.max(), freq="D")
+    z = wide.reindex(days).to_numpy().T
+    fig_heatmap = go.Figure(
+        go.Heatmap(
+            x=days,
+            y=wide.columns,
+            z=z,
+            colorscale="Hot",
+            colorbar=dict(title="cases"),
         )
-    return fig
-
-
-@app.callback(Output("cases-hosp-london", "figure"), Input("cases-hosp", "data"))
-def cases_hosp_london(data):
-    df = pd.DataFrame.from_records(data)
-    df = df.groupby(["date", "sectorName"]).sum("hospitalCases").reset_index()
-    sectors = df.sectorName.unique().tolist()
-
-    fig = go.Figure()
-
-    for sector in sectors:
-        _df = df.loc[df.sectorName == sector]
-        fig.add_trace(
-            go.Scatter(
-                name=sector,
-                x=_df.date,
-                y=_df.hospitalCases,
-            )
-        )
-    return fig
-
-
-@app.callback(Output("cases-hosp", "data"), Input("interval-data", "n_intervals"))
-def request_hosp_cases(n_intervals):
-    """Prepared in wrangle_govuk"""
-    df = HOSP_CASES
-    return df.to_dict("records")
+    )
+    return fig_lines, fig_heatmap
 
 
-@app.callback(Output("cases-popn", "data"), Input("interval-data", "n_intervals"))
-def request_popn_cases(n_intervals):
-    """Prepared in wrangle_govuk"""
-    df = CASES_BY_AGE
-    return df.to_dict("records")
+@app.callback(
+    Output("cases-hosp-ncl", "figure"),
+    Output("cases-hosp-london", "figure"),
+    Output("release-hosp", "data"),
+    Input("interval-data", "n_intervals"),
+    State("release-hosp", "data"),
+)
+def cases_hosp(n_intervals, shown):
+    """Sends the figures only when a new release has been ingested"""
+    release = wgu.store_version("hosp_cases", wgu.engine)
+    since = wgu.window_start()
+    if release == shown or wgu.hosp_series(release, since) is None:
+        # already showing this release or nothing ingested yet
+        raise PreventUpdate
+    return (*hosp_figures(release, since), release)
+
+
+@app.callback(
+    Output("cases-popn-age", "figure"),
+    Output("cases-popn-age2d", "figure"),
+    Output("release-popn", "data"),
+    Input("interval-data", "n_intervals"),
+    State("release-popn", "data"),
+)
+def cases_popn(n_intervals, shown):
+    """Sends the figures only when a new release has been ingested"""
+    release = wgu.store_version("cases_by_age", wgu.engine)
+    since = wgu.window_start()
+    if release == shown or wgu.cases_by_age_series(release, since) is None:
+        raise PreventUpdate
+    return (*popn_figures(release, since), release)
+
+
+@app.callback(
+    Output("cases-popn-age", "figure", allow_duplicate=True),
+    Input("cases-popn-age", "relayoutData"),
+    State("release-popn", "data"),
+    prevent_initial_call=True,
+)
+def cases_popn_age_zoom(relayout, release):
+    """Re-decimates the lines over the zoomed range (or all dates on reset)"""
+    if not relayout or release is None:
+        raise PreventUpdate
+    if "xaxis.range[0]" in relayout:
+        start, end = relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    elif "xaxis.range" in relayout:
+        start, end = relayout["xaxis.range"]
+    elif relayout.get("xaxis.autorange"):
+        start, end = None, None
+    else:
+        # e.g. a change to the y axis only
+        raise PreventUpdate
+
+    wide = wgu.cases_by_age_series(release, wgu.window_start())
+    if wide is None:
+        raise PreventUpdate
+    patch = Patch()
+    for i, age in enumerate(wide.columns):
+        x, y = decimate(wide[age], start, end)
+        patch["data"][i]["x"] = x
+        patch["data"][i]["y"] = y
+    return patch
 
 
 tab_hospital = dbc.Row(
@@ -170,9 +217,10 @@ main = dbc.Tabs(
 
 dash_only = html.Div(
     [
-        dcc.Interval(id="interval-data", interval=24 * 60 * 60 * 1000, n_intervals=0),
-        dcc.Store(id="cases-hosp"),
-        dcc.Store(id="cases-popn"),
+        dcc.Interval(id="interval-data", interval=conf.GOV_UK_REFRESH, n_intervals=0),
+        # release shown in the figures (see wrangle_govuk.store_version)
+        dcc.Store(id="release-hosp"),
+        dcc.Store(id="release-popn"),
     ]
 )
 
@@ -2,57 +2,310 @@
 Functions (callbacks) that provide the functionality
 """
 import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from pathlib import Path
 
 import dash
 import dash_bootstrap_components as dbc
 import dash_daq as daq
+import flask
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import wrangle as wng
 from config import ConfigFactory, footer, header, nav
-from dash import Dash, Input, Output, State
+from dash import ClientsideFunction, Dash, Input, Output, State
 from dash import dash_table as dt
 from dash import dcc, html
+from dash.exceptions import PreventUpdate
 
+import metrics
+import user_store
 import utils
 from app import app
+from cache import WARD_CACHE, shared_backend
+from frame_store import FRAMES
+from prefetch import Prefetcher
+from ward_metrics import WARD_METRICS
 
 conf = ConfigFactory.factory()
 
+# saves should not block readers
+user_store.enable_wal(conf.USER_DATA_SOURCE)
+# archive superseded user edits in the background
+user_store.start_compaction(
+    "sitrep_edits",
+    conf.USER_DATA_SOURCE,
+    conf.USER_EDITS_ARCHIVE,
+    interval=conf.USER_COMPACT_INTERVAL,
+    lock_path=conf.USER_COMPACT_LOCK,
+)
+
 
 def request_data(ward):
+    """
+    Gets data for the named ward from the server side cache
+    only going back to the source systems when the data has changed
+
+    :param      ward:  The ward
+    :type       ward:  string
+    """
+    with metrics.span("request_data"):
+        return WARD_CACHE.get(
+            ward,
+            loader=partial(load_data, ward),
+            fingerprint=partial(fingerprint_data, ward),
+        )
+
+
+def refresh_data(ward):
+    """
+    Refreshes the cached data for the named ward (used by the prefetcher)
+    If upstream cannot say whether it changed the data is reloaded unless it
+    would still be within the TTL at the next prefetch (e.g. a user just loaded it)
+    """
+    WARD_CACHE.refresh(
+        ward,
+        loader=partial(load_data, ward),
+        fingerprint=partial(fingerprint_data, ward),
+        unknown_max_age=max(conf.CACHE_TTL - conf.PREFETCH_INTERVAL, 0),
+    )
+
+
+def has_source(ward) -> bool:
+    """
+    False if there is no sitrep or census data for the ward
+    i.e. a sample file is missing in development; always True against the API
+    """
+    if not conf.DEV_HYLODE:
+        return True
+    return all(Path(wng.gen_hylode_url(url, ward)).exists() for url in ["sitrep", "census"])
+
+
+def fingerprint_data(ward):
+    """
+    Returns a token that changes when any upstream source for the ward changes
+    or None if any source cannot say (which forces a reload)
+
+    User edits are not included; write_data invalidates the cache instead
+    """
+    tokens = (
+        wng.get_hylode_fingerprint(wng.gen_hylode_url("sitrep", ward), dev=conf.DEV_HYLODE),
+        wng.get_hylode_fingerprint(wng.gen_hylode_url("census", ward), dev=conf.DEV_HYLODE),
+        wng.get_hylode_fingerprint(conf.SKELETON_DATA_SOURCE, dev=True),
+    )
+    return None if None in tokens else tokens
+
+
+def load_data(ward):
     """
     Gets data from source system for the named ward
-    
+
     :param      ward:  The ward
     :type       ward:  string
     """
-    # prepare the URL and get the data as per sitrep API
+    # prepare the URLs for the sitrep and census APIs
     url_ward = wng.gen_hylode_url("sitrep", ward)
-    df_ward = wng.get_hylode_data(url_ward, dev=conf.DEV_HYLODE)
-
-    # prepare the URL and get the data as per census API
     url_census = wng.gen_hylode_url("census", ward)
-    df_census = wng.get_hylode_data(url_census, dev=conf.DEV_HYLODE)
+
+    # fetch all sources concurrently; none depends on another
+    sources = wng.fetch_sources(
+        {
+            "sitrep": partial(wng.get_hylode_snapshot, url_ward, dev=conf.DEV_HYLODE),
+            "census": partial(wng.get_hylode_snapshot, url_census, dev=conf.DEV_HYLODE),
+            "user": partial(
+                wng.get_user_data,
+                "sitrep_edits",
+                conf.USER_DATA_SOURCE,
+                dev=conf.DEV_USER,
+                ward=ward,
+            ),
+            "skeleton": partial(
+                wng.get_bed_skeleton, ward, conf.SKELETON_DATA_SOURCE, dev=conf.DEV
+            ),
+        }
+    )
+
+    df_ward = sources["sitrep"]
+    df_census = sources["census"]
 
     # assume census API is correct and drop unmatched patients returned by sitrep
     df_clean = wng.merge_census_data(df_ward, df_census, dev=conf.DEV_HYLODE)
 
     # merge in user updates to data
-    df_user = wng.get_user_data('sitrep_edits', conf.USER_DATA_SOURCE, dev=conf.DEV_USER)
     # merge in 'empty beds' using the reported skeleton
-    df_skeleton = wng.get_bed_skeleton(ward, conf.SKELETON_DATA_SOURCE, dev=conf.DEV)
-    df_orig = wng.merge_hylode_user_data(df_skeleton, df_clean, df_user)
+    df_orig = wng.merge_hylode_user_data(
+        sources["skeleton"], df_clean, sources["user"]
+    )
     # data wrangling
     df = wng.wrangle_data(df_orig, conf.COLS)
     return df
 
 
+def _or_none(name, func):
+    """Wraps a source so that one ward failing does not fail the whole batch"""
+
+    def wrapper():
+        try:
+            return func()
+        except Exception:
+            logging.exception(f"--- {name} failed to load")
+            return None
+
+    return wrapper
+
+
+# the hospital batch has its own threads, one per source, so that its sources
+# neither queue behind one another nor behind the per ward loads and prefetches
+HOSPITAL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=1 + 3 * len(conf.ICU_WARDS), thread_name_prefix="hospital"
+)
+
+
+def load_hospital(wards=conf.ICU_WARDS):
+    """
+    Gets data for all the wards in one batch
+
+    Every source for every ward is fetched at once, the wards are concatenated
+    and each step (merge_census_data, apply_user_edits, wrangle_data) runs once
+    over the combined frame keyed by ward_code rather than once per ward.
+    User edits for all the wards are read in a single query.
+    Wards whose sources fail or do not load in time are left out
+    (see the 'missing' attribute).
+
+    :returns:   one row per bed for all the wards, id is ward_code:bed_code
+    """
+    sources = {"user": partial(
+        wng.get_user_data,
+        "sitrep_edits",
+        conf.USER_DATA_SOURCE,
+        dev=conf.DEV_USER,
+        ward=list(wards),
+    )}
+    timeouts = {"user": conf.SOURCE_TIMEOUTS["user"]}
+    for ward in wards:
+        for name in ["sitrep", "census"]:
+            sources[f"{ward}:{name}"] = _or_none(f"{ward}:{name}", partial(
+                wng.get_hylode_snapshot,
+                wng.gen_hylode_url(name, ward),
+                dev=conf.DEV_HYLODE,
+                # kept apart from the snapshots of the per ward loads
+                name=f"{conf.HOSPITAL_KEY}:{wng.gen_hylode_url(name, ward)}",
+            ))
+        sources[f"{ward}:skeleton"] = _or_none(f"{ward}:skeleton", partial(
+            wng.get_bed_skeleton, ward, conf.SKELETON_DATA_SOURCE, dev=conf.DEV
+        ))
+        timeouts.update({f"{ward}:{k}": v for k, v in conf.SOURCE_TIMEOUTS.items()})
+    res = wng.fetch_sources(
+        sources,
+        timeouts=timeouts,
+        optional=[k for k in sources if k != "user"],
+        executor=HOSPITAL_EXECUTOR,
+    )
+
+    loaded = [
+        w for w in wards
+        if all(res[f"{w}:{k}"] is not None for k in ["sitrep", "census", "skeleton"])
+    ]
+    missing = [w for w in wards if w not in loaded]
+    if not loaded:
+        raise RuntimeError(f"no ward could be loaded ({', '.join(wards)})")
+
+    df_ward = pd.concat([res[f"{w}:sitrep"] for w in loaded], ignore_index=True)
+    df_census = pd.concat([res[f"{w}:census"] for w in loaded], ignore_index=True)
+    df_skeleton = pd.concat([res[f"{w}:skeleton"] for w in loaded], ignore_index=True)
+
+    df_clean = wng.merge_census_data(df_ward, df_census, dev=conf.DEV_HYLODE)
+    df_orig = wng.merge_hylode_user_data(df_skeleton, df_clean, res["user"])
+    df = wng.wrangle_data(df_orig, conf.COLS)
+    df.attrs["missing"] = missing
+    return df
+
+
+def fingerprint_hospital(wards=conf.ICU_WARDS):
+    """
+    As per fingerprint_data for every ward
+    A ward whose sources cannot be reached counts as unchanged while it stays
+    unreachable so that one missing ward does not force a reload of them all
+    """
+    tokens = []
+    for ward in wards:
+        try:
+            tokens.append(fingerprint_data(ward))
+        except Exception as e:
+            logging.warning(f"--- {ward} fingerprint failed ({e})")
+            tokens.append(("missing", ward))
+    return None if None in tokens else tokens
+
+
+def request_hospital():
+    """All the ICU wards from the server side cache (see load_hospital)"""
+    with metrics.span("request_hospital"):
+        return WARD_CACHE.get(
+            conf.HOSPITAL_KEY, loader=load_hospital, fingerprint=fingerprint_hospital
+        )
+
+
+def summarise_wards(df: pd.DataFrame, wards: list) -> pd.DataFrame:
+    """
+    Beds, occupied and empty beds and occupancy for each ward and in total
+
+    :param      df:     as per load_hospital
+    :param      wards:  the rows (in order); wards without data are left blank
+    """
+    g = df.groupby("ward_code")
+    res = pd.DataFrame(dict(beds=g.size(), occupied=g["name"].count()))
+    res = res.reindex([w.upper() for w in wards])
+    res.loc["Total"] = res.sum()
+    res["empty"] = res["beds"] - res["occupied"]
+    res["occupancy"] = res["occupied"] / res["beds"]
+    return res
+
+
+def resolve_source(source):
+    """
+    Returns the frame behind the version key held in source-data
+    falling back to the source systems if it has been evicted
+
+    :param      source:  dict(ward, version) as stored by data_io
+    """
+    df = FRAMES.get(source["version"])
+    if df is None:
+        df = request_data(source["ward"])
+    return df
+
+
+# keep every ward with a source warm so that switching wards does not wait on the source systems
+PREFETCHER = Prefetcher(
+    [ward for ward in conf.ICU_WARDS if has_source(ward)],
+    refresh_data,
+    interval=conf.PREFETCH_INTERVAL,
+    workers=conf.PREFETCH_WORKERS,
+    jitter=conf.PREFETCH_JITTER,
+    max_backoff=conf.PREFETCH_MAX_BACKOFF,
+    backend=shared_backend(),
+)
+if conf.PREFETCH:
+    PREFETCHER.start(lock_path=conf.PREFETCH_LOCK)
+
+
+@app.server.route("/status/prefetch")
+def prefetch_status():
+    """Last refresh time and duration for each ward"""
+    return flask.jsonify(PREFETCHER.status())
+
+
 @app.callback(
-    output=dict(json_data=Output("source-data", "data")),  # output data to store
+    output=dict(
+        json_data=Output("source-data", "data"),  # output version key to store
+        status=Output("tbl-save-status", "children"),
+    ),
     inputs=dict(
-        dfjson=State("tbl-main", "data"),
+        source=State("source-data", "data"),
+        dirty=State("tbl-dirty", "data"),
         ward=Input("icu_active", "data"),
         intervals=Input("interval-data", "n_intervals"),
         save_btn=Input("tbl-save", "n_clicks"),
@@ -60,9 +313,9 @@ def request_data(ward):
     ),
     prevent_initial_call=True,  # suppress_callback_exceptions does not work
 )
-def data_io(dfjson, ward, save_btn, reset_btn, intervals):
+def data_io(source, dirty, ward, save_btn, reset_btn, intervals):
     """
-    stores the data in a dcc.Store
+    stores the data server side and its version key in a dcc.Store
     runs on load and will be triggered each time the table is updated or the REFRESH_INTERVAL elapses
     kind of routes the load/save/reset actions
     """
@@ -70,66 +323,105 @@ def data_io(dfjson, ward, save_btn, reset_btn, intervals):
     trigger = ctx.triggered[0]
     print(trigger)
     ward = ward.lower()
+    status = None
 
     if trigger['prop_id'] == 'icu_active.data':
         print(f"***INFO: switching units to {ward}")
         df = request_data(ward)
+    elif trigger['prop_id'] == 'interval-data.n_intervals':
+        print(f"***INFO: refreshing {ward}")
+        df = request_data(ward)
     elif trigger['prop_id'] == 'tbl-reset.n_clicks':
         print(f"***INFO: resetting to initial data load")
         df = request_data(ward)
     elif trigger['prop_id'] == 'tbl-save.n_clicks':
         print(f"***INFO: CACHING data back to dash.Store")
-        # collect the data from source
-        dfo = request_data(ward)
-        # collect the data from the displayed datatable
-        dfn = pd.DataFrame.from_records(dfjson)
-        # compare
-        df_edits = utils.tbl_compare(dfo, dfn, cols2save=['wim_1', 'discharge_ready_1_4h'], idx=['ward_code', 'mrn'])
+        # the version the cells were edited against; shared by the workers
+        # unless CACHE_TYPE is SimpleCache
+        dfo = FRAMES.get(source["version"]) if source else None
+        if dfo is None:
+            # comparing with the data now would hide any conflict so do not save
+            print(f"***WARNING: version {source and source['version']} not found; edits not saved")
+            return dict(
+                json_data=dash.no_update,
+                status=dbc.Alert(
+                    "Edits not saved: the data they were made against is no longer held. "
+                    "Reset the table and make the edits again.",
+                    color="danger",
+                    dismissable=True,
+                ),
+            )
+        # the data now as last loaded (at most CACHE_TTL old) so a change
+        # upstream since then is not seen as a conflict; only goes upstream
+        # (via request_data) if nothing that recent is cached
+        df = WARD_CACHE.peek(ward, max_age=conf.CACHE_TTL)
+        if df is None:
+            df = request_data(ward)
+        df_edits, conflicts = utils.cells_to_edits(
+            dfo, df, dirty or {}, cols2save=['wim_1', 'discharge_ready_1_4h'], idx=['ward_code', 'mrn']
+        )
+        if conflicts:
+            print(f"***WARNING: {len(conflicts)} edits conflict with newer data and were not saved")
+            print(conflicts)
+            status = dbc.Alert(
+                f"{len(conflicts)} edit(s) not saved: the data changed since the table was loaded. "
+                f"NB: edits are checked against data up to {conf.CACHE_TTL}s old "
+                "so a more recent change may not be caught.",
+                color="warning",
+                dismissable=True,
+            )
         if df_edits.shape[0]:
             print(df_edits)
-            # TODO: write function to save updates to database or file store (i.e. user data)
             wng.write_data(df_edits, 'sitrep_edits', conf.USER_DATA_SOURCE)
             # then re-rerun request_data which should now bring in fresh 'user data'
-            # return this
             df = request_data(ward)
         else:
             print("***WARNING: No edits found to save")
-            # return just the original data
-            df = dfo
-
-        # TODO: write function to replay updates onto original
-        # this should be part of the 'read data in' i.e. just uses the existing 'merge user' functionality
 
     else:
         raise NotImplementedError
 
-    return dict(json_data=df.to_dict("records"))
+    # refreshes are sent to the table as patches; everything else in full
+    refresh = trigger['prop_id'] == 'interval-data.n_intervals'
+    return dict(
+        json_data=dict(ward=ward, version=FRAMES.put(df), refresh=refresh),
+        status=status,
+    )
 
 
-@app.callback(
-    Output("tbl-main", "data"),
+# table-local behaviour (tracking and highlighting unsaved edits) runs in the
+# browser; see assets/sitrep.js
+app.clientside_callback(
+    ClientsideFunction(namespace="sitrep", function_name="track_dirty"),
+    Output("tbl-dirty", "data"),
     Input("tbl-main", "data_timestamp"),
     State("tbl-main", "data"),
-    prevent_initial_call=True,  # suppress_callback_exceptions does not work
+    State("tbl-main", "data_previous"),
+    State("tbl-dirty", "data"),
+    prevent_initial_call=True,
 )
-def update_table(timestamp, rows):
-    # TODO: can you highlight using colour those fields that are edited but not saved
-    for i, row in enumerate(rows):
-        if i == 2:
-            print(row)
-    return rows
-
 
-@app.callback(
-    Output("datatable-main", "children"),
-    Input("source-data", "data"),
-    State("icu_active", "data"),
+app.clientside_callback(
+    ClientsideFunction(namespace="sitrep", function_name="style_dirty"),
+    Output("tbl-main", "style_data_conditional"),
+    Input("tbl-dirty", "data"),
+    State("tbl-style-base", "data"),
 )
-def gen_datatable_main(json_data, icu):
-    print(f"Working with {icu}")
 
-    # datatable defined by columns and by input data
-    # abstract this to function so that you can guarantee the same data each time
+# striped rows
+STYLE_DATA_CONDITIONAL = [
+    {
+        "if": {"row_index": "odd"},
+        "backgroundColor": "rgb(220, 220, 220)",
+    }
+]
+
+
+def gen_datatable_main():
+    """
+    Builds the main table once (at import); only its data is updated afterwards
+    """
+    # datatable defined by columns here; data is sent by update_datatable_main
 
     COL_DICT = [
         {"name": v, "id": k} for k, v in conf.COLS.items() if k in conf.COLS_FULL
@@ -155,7 +447,7 @@ def gen_datatable_main(json_data, icu):
         dt.DataTable(
             id="tbl-main",
             columns=COL_DICT,
-            data=json_data,
+            data=[],
             editable=False,
             dropdown={
                 "discharge_ready_1_4h": {
@@ -177,13 +469,7 @@ def gen_datatable_main(json_data, icu):
                 {"if": {"column_id": "discharge_ready_1_4h"}, "textAlign": "left"},
             ],
             style_data={"color": "black", "backgroundColor": "white"},
-            # striped rows
-            style_data_conditional=[
-                {
-                    "if": {"row_index": "odd"},
-                    "backgroundColor": "rgb(220, 220, 220)",
-                }
-            ],
+            style_data_conditional=STYLE_DATA_CONDITIONAL,
             sort_action="native",
             cell_selectable=True,  # possible to click and navigate cells
             # row_selectable="single",
@@ -200,6 +486,140 @@ def gen_datatable_main(json_data, icu):
     return dto
 
 
+@app.callback(
+    Output("tbl-main", "data"),
+    Output("tbl-version", "data"),
+    Output("tbl-dirty", "data", allow_duplicate=True),
+    Input("source-data", "data"),
+    State("tbl-version", "data"),
+    State("tbl-dirty", "data"),
+    prevent_initial_call=True,
+)
+def update_datatable_main(json_data, shown, dirty):
+    """
+    Sends the table data for the new version
+    On a refresh where the beds are unchanged only the rows that differ from
+    the version already shown are sent (as a Patch keyed by the row id)
+    which also leaves any unsaved edits in the other rows alone
+    Unsaved edits are forgotten for any row that is sent
+    """
+    cols = conf.COLS_FULL + ["id"]
+    df = resolve_source(json_data)[cols]
+    metrics.sample_frame("tbl-main", df)
+
+    dfo = FRAMES.get(shown["version"]) if shown else None
+    if (
+        not json_data.get("refresh")
+        or dfo is None
+        or shown["ward"] != json_data["ward"]
+        or not dfo["id"].equals(df["id"])
+    ):
+        return df.to_dict("records"), json_data, {}
+
+    dfo = dfo[cols]
+    changed = ~((df == dfo) | (df.isna() & dfo.isna())).all(axis=1)
+    print(f"***INFO: patching {changed.sum()} of {len(df)} rows")
+    if not changed.any():
+        return dash.no_update, json_data, dash.no_update
+    patch = dash.Patch()
+    for i, row in zip(np.flatnonzero(changed), df[changed].to_dict("records")):
+        patch[int(i)] = row
+    dirty = {k: v for k, v in (dirty or {}).items() if k not in set(df.index[changed])}
+    return patch, json_data, dirty
+
+
+@app.callback(
+    Output("ward-metrics", "children"),
+    Input("source-data", "data"),
+    prevent_initial_call=True,
+)
+def update_ward_metrics(json_data):
+    """
+    Aggregates for the active ward
+    Recomputed only when the version of the ward's data changes
+    """
+    if not json_data:
+        raise PreventUpdate
+    m = WARD_METRICS.get(json_data["ward"], json_data["version"], partial(resolve_source, json_data))
+
+    def counts(d):
+        return " · ".join(f"{k} {v}" for k, v in d.items()) or "-"
+
+    occupancy = f"{m['occupied']} of {m['beds']}"
+    if m["occupancy"] is not None:
+        occupancy += f" ({m['occupancy']:.0%})"
+    wim = {f"{k:g}": v for k, v in m["wim"].items()}
+    los = " · ".join(f"{q:.0%} {v:.1f}" for q, v in m["los"].items()) or "-"
+    rows = [
+        ("Occupied", occupancy),
+        (conf.COLS["vent_type_1_4h"], counts(m["vent"])),
+        (conf.COLS["wim_1"], f"total {m['wim_sum']:g} ({counts(wim)})"),
+        (conf.COLS["discharge_ready_1_4h"], f"{m['discharge_ready']} ready ({counts(m['discharge'])})"),
+        (f"{conf.COLS['elapsed_los_td']} (days)", los),
+    ]
+    return dbc.Table(
+        html.Tbody([html.Tr([html.Th(k), html.Td(v)]) for k, v in rows]),
+        size="sm",
+        className="mb-3",
+    )
+
+
+@app.callback(
+    Output("hospital-summary", "data"),
+    Input("interval-data", "n_intervals"),
+)
+def update_hospital_summary(n_intervals):
+    """
+    Hospital wide summary; only on load and each REFRESH_INTERVAL
+    so that switching ward does not go back to request_hospital
+    """
+    df = request_hospital()
+    summary = summarise_wards(df, conf.ICU_WARDS).rename_axis("ward").reset_index()
+    return dict(
+        rows=summary.astype(object).where(summary.notna(), None).to_dict("records"),
+        missing=df.attrs.get("missing", []),
+        loaded=f"{datetime.now():%H:%M}",
+    )
+
+
+@app.callback(
+    Output("ward-aggregate", "children"),
+    Output("ward-aggregate-footer", "children"),
+    Input("icu_active", "data"),
+    Input("hospital-summary", "data"),
+)
+def update_ward_aggregate(ward, hospital):
+    """Hospital wide summary (see update_hospital_summary) with the active ward highlighted"""
+    if not hospital:
+        raise PreventUpdate
+
+    def fmt(v, pct=False):
+        if pd.isna(v):
+            return "-"
+        return f"{v:.0%}" if pct else f"{v:.0f}"
+
+    header = html.Thead(html.Tr([html.Th(c) for c in ["Ward", "Beds", "Occupied", "Empty", "Occupancy"]]))
+    rows = []
+    for r in hospital["rows"]:
+        w = r["ward"]
+        cells = [w, fmt(r["beds"]), fmt(r["occupied"]), fmt(r["empty"]), fmt(r["occupancy"], pct=True)]
+        active = ward is not None and w == ward.upper()
+        rows.append(
+            html.Tr(
+                [html.Th(cells[0])] + [html.Td(c) for c in cells[1:]],
+                className="table-primary" if active else ("fw-bold" if w == "Total" else None),
+            )
+        )
+    table = dbc.Table([header, html.Tbody(rows)], size="sm", hover=True, className="mb-0")
+
+    missing = hospital["missing"]
+    n = len(conf.ICU_WARDS)
+    footer = f"{n - len(missing)} of {n} ICUs loaded in one batch at {hospital['loaded']}"
+    if missing:
+        footer += f"; no data for {', '.join(missing)}"
+    return table, footer
+
+
 @app.callback(Output("icu_active", "data"), Input("icu_radio", "value"))
 def store_icu_active(value):
     print(f"Storing active ICU as {value.lower()}")
@@ -230,14 +650,8 @@ icu_radio_button = html.Div(
                     inputClassName="btn-check",
                     labelClassName="btn btn-outline-primary",
                     labelCheckedClassName="active btn-primary",
-                    options=[
-                        {"label": "T03", "value": "T03"},
-                        {"label": "T06", "value": "T06"},
-                        {"label": "GWB", "value": "GWB"},
-                        {"label": "WMS", "value": "WMS"},
-                        {"label": "NHNN", "value": "NHNN"},
-                    ],
-                    value="T03",
+                    options=[{"label": i, "value": i} for i in conf.ICU_WARDS],
+                    value=conf.ICU_WARDS[0],
                 )
             ],
             className="dbc",
@@ -264,6 +678,7 @@ save_reset_button = html.Div(
         ),
         # ]
         # ),
+        html.Div(id="tbl-save-status"),
     ],
 )
 
@@ -284,7 +699,7 @@ main = dbc.Container(
         dbc.Row(
             [
                 dbc.Col(
-                    [html.Div(id="datatable-main")],
+                    [html.Div(id="datatable-main", children=gen_datatable_main())],
                     md=6,
                 ),
                 dbc.Col(
@@ -294,8 +709,10 @@ main = dbc.Container(
                                 dbc.Card(
                                     [
                                         dbc.CardHeader("Ward aggregate details"),
-                                        dbc.CardBody("CardBody"),
-                                        dbc.CardFooter("CardFooter"),
+                                        dbc.CardBody(
+                                            [html.Div(id="ward-metrics"), html.Div(id="ward-aggregate")]
+                                        ),
+                                        dbc.CardFooter(id="ward-aggregate-footer"),
                                     ]
                                 ),
                             ],
@@ -333,8 +750,15 @@ dash_only = html.Div(
         dcc.Store(id="icu_active"),
         # use this to source-data when the data changes
         dcc.Store(id="source-data"),
+        # which version of source-data the table is showing
+        dcc.Store(id="tbl-version"),
+        # edited but unsaved cells (maintained in the browser)
+        dcc.Store(id="tbl-dirty", data={}),
+        dcc.Store(id="tbl-style-base", data=STYLE_DATA_CONDITIONAL),
         # dcc.Store(id="tbl-active-row"),
         dcc.Store(id="tbl-side-selection"),
+        # all the ICUs as per update_hospital_summary (refreshed with interval-data)
+        dcc.Store(id="hospital-summary"),
     ]
 )
 
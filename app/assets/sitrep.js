@@ -0,0 +1,68 @@
+/*
+Clientside callbacks for the sitrep table
+These run in the browser so editing a cell costs no round trip to the server
+*/
+
+function sameValue(a, b) {
+    // the table returns edited numbers as strings
+    if (a === null || a === undefined) {
+        return b === null || b === undefined;
+    }
+    return b !== null && b !== undefined && String(a) === String(b);
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    sitrep: {
+        // records cells edited since the data was last sent by the server
+        // as {row id: {column: {orig: value as sent, value: value now}}}
+        track_dirty: function (timestamp, data, data_previous, dirty) {
+            dirty = Object.assign({}, dirty || {});
+            if (!data || !data_previous) {
+                return dirty;
+            }
+            const previous = {};
+            data_previous.forEach(function (row) {
+                previous[row.id] = row;
+            });
+            data.forEach(function (row) {
+                const old = previous[row.id];
+                if (!old) {
+                    return;
+                }
+                Object.keys(row).forEach(function (col) {
+                    if (sameValue(row[col], old[col])) {
+                        return;
+                    }
+                    const cells = Object.assign({}, dirty[row.id]);
+                    const orig = col in cells ? cells[col].orig : old[col];
+                    if (sameValue(row[col], orig)) {
+                        delete cells[col];
+                    } else {
+                        cells[col] = {orig: orig, value: row[col]};
+                    }
+                    if (Object.keys(cells).length) {
+                        dirty[row.id] = cells;
+                    } else {
+                        delete dirty[row.id];
+                    }
+                });
+            });
+            return dirty;
+        },
+
+        // highlights edited but unsaved cells on top of the base table styles
+        style_dirty: function (dirty, base) {
+            const rules = (base || []).slice();
+            Object.keys(dirty || {}).forEach(function (id) {
+                Object.keys(dirty[id]).forEach(function (col) {
+                    rules.push({
+                        if: {filter_query: '{id} = "' + id + '"', column_id: col},
+                        backgroundColor: "rgb(255, 243, 205)",
+                        fontStyle: "italic",
+                    });
+                });
+            });
+            return rules;
+        },
+    },
+});
@@ -0,0 +1,184 @@
+"""
+Server side cache for the wrangled ward data
+Avoids re-requesting and re-wrangling a ward when nothing upstream has changed
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from config import ConfigFactory
+
+conf = ConfigFactory.factory()
+
+
+class WardCache:
+    """
+    Least recently used cache of dataframes keyed by ward
+
+    Entries younger than ttl are returned as is. Older entries are checked
+    against an upstream fingerprint (e.g. ETag, Last-Modified or a file
+    mtime) and only reloaded if that fingerprint has changed.
+
+    If a backend (e.g. a Flask-Caching Cache) is given, entries are kept
+    there instead so that they are shared between worker processes; the
+    backend is then responsible for eviction.
+    """
+
+    def __init__(self, ttl: float, maxsize: int, backend=None):
+        """
+        :param      ttl:      seconds before an entry is checked against upstream
+        :param      maxsize:  maximum number of wards to hold (in process only)
+        :param      backend:  shared cache with get, set and delete
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.backend = backend
+        self._store = OrderedDict()
+        self._invalidated = {}
+        self._lock = threading.RLock()
+
+    def get(self, ward: str, loader, fingerprint=None):
+        """
+        Returns the cached frame for the ward or loads it
+
+        :param      ward:         The ward
+        :param      loader:       callable taking no arguments that returns the frame
+        :param      fingerprint:  callable taking no arguments that returns a
+                                  token that changes when upstream changes;
+                                  a token of None is treated as 'changed'
+
+        :returns:   a copy of the cached frame
+        :rtype:     pd.DataFrame
+        """
+        ward = ward.lower()
+        entry = self._get_entry(ward)
+        if entry is not None and time.time() - entry["loaded_at"] < self.ttl:
+            logging.info(f"--- using cached data for {ward}")
+            return entry["df"].copy()
+        return self.refresh(ward, loader, fingerprint).copy()
+
+    def refresh(self, ward: str, loader, fingerprint=None, unknown_max_age: float = 0):
+        """
+        Reloads the ward unless the upstream fingerprint is unchanged
+        regardless of the TTL (e.g. from a background job)
+
+        :param      unknown_max_age:  seconds; when there is no fingerprint to
+                                      compare with, a cached entry loaded more
+                                      recently than this is kept (0 always reloads)
+
+        :returns:   the cached frame (not a copy)
+        """
+        ward = ward.lower()
+        entry = self._get_entry(ward)
+        try:
+            token = fingerprint() if fingerprint else None
+        except Exception as e:
+            # e.g. the source file does not exist; treated as 'changed'
+            logging.warning(f"--- fingerprint for {ward} failed ({e})")
+            token = None
+        if entry is not None and token is not None and token == entry["fingerprint"]:
+            logging.info(f"--- upstream unchanged; using cached data for {ward}")
+            entry["loaded_at"] = time.time()
+            self._set_entry(ward, entry)
+            return entry["df"]
+        if (
+            entry is not None
+            and token is None
+            and time.time() - entry["loaded_at"] < unknown_max_age
+        ):
+            logging.info(f"--- no fingerprint for {ward}; keeping recently loaded data")
+            return entry["df"]
+
+        started = time.time()
+        df = loader()
+        # an invalidate while loading (e.g. write_data) means df may be stale
+        if self._invalidated_at(ward) >= started:
+            logging.info(f"--- {ward} invalidated while loading; not caching")
+            return df
+        self.put(ward, df, token)
+        return df
+
+    def peek(self, ward: str, max_age: float = None):
+        """
+        Returns a copy of the cached frame for the ward
+        or None if there is none (or it is older than max_age seconds);
+        never goes to the loader
+        """
+        entry = self._get_entry(ward.lower())
+        if entry is None:
+            return None
+        if max_age is not None and time.time() - entry["loaded_at"] >= max_age:
+            return None
+        return entry["df"].copy()
+
+    def put(self, ward: str, df, fingerprint=None):
+        """Stores the frame for the ward"""
+        entry = dict(df=df, fingerprint=fingerprint, loaded_at=time.time())
+        self._set_entry(ward.lower(), entry)
+
+    def invalidate(self, ward: str = None):
+        """
+        Drops the ward from the cache (or everything if no ward given)
+        and stops any load already under way from caching its result
+        """
+        key = "*" if ward is None else ward.lower()
+        if self.backend is not None:
+            if ward is None:
+                # NB: clears everything else held in the backend too
+                self.backend.clear()
+            else:
+                self.backend.delete(f"ward:{key}")
+            self.backend.set(f"invalidated:{key}", time.time())
+            return
+        with self._lock:
+            if ward is None:
+                self._store.clear()
+            else:
+                self._store.pop(key, None)
+            self._invalidated[key] = time.time()
+
+    def _invalidated_at(self, ward: str) -> float:
+        """When the ward (or everything) was last invalidated"""
+        keys = [f"invalidated:{ward}", "invalidated:*"]
+        if self.backend is not None:
+            return max(self.backend.get(k) or 0 for k in keys)
+        with self._lock:
+            return max(self._invalidated.get(k.split(":")[1], 0) for k in keys)
+
+    def _get_entry(self, ward: str):
+        if self.backend is not None:
+            return self.backend.get(f"ward:{ward}")
+        with self._lock:
+            entry = self._store.get(ward)
+            if entry is not None:
+                self._store.move_to_end(ward)
+        return entry
+
+    def _set_entry(self, ward: str, entry: dict):
+        if self.backend is not None:
+            self.backend.set(f"ward:{ward}", entry)
+            return
+        with self._lock:
+            self._store[ward] = entry
+            self._store.move_to_end(ward)
+            while len(self._store) > self.maxsize:
+                evicted, _ = self._store.popitem(last=False)
+                logging.info(f"--- evicted {evicted} from ward cache")
+
+
+def shared_backend():
+    """
+    The Flask-Caching cache shared by worker processes (see app.py)
+    or None if the cache is per process (SimpleCache)
+    """
+    if conf.CACHE_CONFIG["CACHE_TYPE"] == "SimpleCache":
+        return None
+    from app import flask_cache
+
+    return flask_cache
+
+
+WARD_CACHE = WardCache(
+    ttl=conf.CACHE_TTL, maxsize=conf.CACHE_MAX_WARDS, backend=shared_backend()
+)
@@ -40,9 +40,57 @@ class Config:
     SERVER_PORT = 8009
 
     # Checks for remote updates on the server
-    # TODO: feels like we need to run as a check that looks for an update time stamp but does not update the table
-    # until the server data changes
-    REFRESH_INTERVAL = 60 * 60 * 1000  # milliseconds
+    # cheap because the ward cache only reloads when the upstream fingerprint changes
+    REFRESH_INTERVAL = 5 * 60 * 1000  # milliseconds
+
+    # Server side cache of the wrangled ward data (see cache.py)
+    CACHE_TTL = int(environ.get("CACHE_TTL", 60))  # seconds before checking upstream for changes
+    CACHE_MAX_WARDS = 8
+
+    # Flask-Caching backend (see app.py)
+    # SimpleCache is per process; use FileSystemCache (or RedisCache) so that
+    # gunicorn workers share ward data rather than each fetching from HYLODE
+    CACHE_CONFIG = {
+        "CACHE_TYPE": environ.get("CACHE_TYPE", "SimpleCache"),
+        "CACHE_DIR": environ.get("CACHE_DIR", "data/cache"),
+        "CACHE_THRESHOLD": 500,
+        "CACHE_DEFAULT_TIMEOUT": 0,  # never expires; WardCache checks freshness
+        "CACHE_REDIS_URL": environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0"),
+    }
+    # only the process holding this lock prefetches (another takes over if it exits)
+    # NB: with a per process cache (SimpleCache) only that process is kept warm
+    PREFETCH_LOCK = Path("data/cache/prefetch.lock")
+
+    # Wards offered by the sitrep page and kept warm in the background (see prefetch.py)
+    ICU_WARDS = ["T03", "T06", "GWB", "WMS", "NHNN"]
+    HOSPITAL_KEY = "hospital"  # cache key for all ICU_WARDS loaded in one batch
+    PREFETCH = True
+    PREFETCH_INTERVAL = 45  # seconds; less than CACHE_TTL so switching wards stays warm
+    PREFETCH_WORKERS = 2
+    PREFETCH_JITTER = 0.1  # +/- fraction of the interval
+    PREFETCH_MAX_BACKOFF = 15 * 60  # seconds
+
+    # Seconds to wait for each data source when loading a ward
+    # sources are fetched concurrently so these are measured from the same start
+    SOURCE_TIMEOUTS = {
+        "sitrep": 30,
+        "census": 30,
+        "user": 10,
+        "skeleton": 10,
+    }
+
+    # Shared HTTP client for HYLODE (see hylode_client.py)
+    HYLODE_TIMEOUT = (3.05, 10)  # seconds (connect, read)
+    HYLODE_RETRIES = 2
+    HYLODE_BACKOFF = 0.5
+    HYLODE_POOL_SIZE = 10
+
+    # Frames held server side for dcc.Store version keys (see frame_store.py)
+    FRAME_STORE_SIZE = 32
+    METRICS_FRAME_SAMPLE = 0.1  # fraction of frames whose size is recorded (see metrics.py)
+
+    # Timestamps are displayed in local time
+    DISPLAY_TZ = "Europe/London"
 
     COLS = OrderedDict(
         {
@@ -70,6 +118,9 @@ class Config:
         "mrn": str
     }
 
+    # length of stay quantiles on the ward aggregate card (see ward_metrics.py)
+    LOS_QUANTILES = (0.25, 0.5, 0.75, 0.9)
+
     COLS_FULL = ["bay", "bed", "name", "mrn", "admission_age_years", "sex", "wim_1", "discharge_ready_1_4h"]
     # COLS_FULL = {i:COLS[i] for i in COLS_FULL}
 
@@ -78,22 +129,44 @@ class Config:
 
     COL_NAMES = [{"name": v, "id": k} for k, v in COLS.items()]
 
+    # User edits (see user_store.py)
+    USER_EDIT_RECENCY_HOURS = 12  # edits older than this are ignored
+    USER_EDITS_ARCHIVE = "sitrep_edits_archive"
+    USER_COMPACT_INTERVAL = 60 * 60  # seconds between archiving superseded edits
+    # only one worker process compacts
+    USER_COMPACT_LOCK = Path("data/cache/compact.lock")
+
     SKELETON_DATA_SOURCE = Path("data/skeleton.csv")
     ETR_COLUMNS = Path("data/external/etr-columns.csv")
     ETR_DATA = Path("data/external/etr.csv")
+    # request log and validators; the data itself is in GOV_UK_STORE
     GOV_UK_ENGINE = create_engine("sqlite:///data/gov.db")
+    GOV_UK_STORE = Path("data/govuk")  # Parquet partitioned by month
+    GOV_UK_WINDOW_DAYS = 365 + 31  # days of data shown on the covid page
+
+    # gov.uk COVID data ingested in the background (see wrangle_govuk.py)
+    GOV_UK_INGEST = True
+    GOV_UK_INTERVAL = 60 * 60  # seconds between checks for a new release
+    GOV_UK_TIMEOUT = (3.05, 60)  # (connect, read) seconds; the datasets are large
+    GOV_UK_LOCK = Path("data/cache/govuk.lock")
+    GOV_UK_REFRESH = 60 * 60 * 1000  # ms between the covid page re-reading the store
+    COVID_MAX_POINTS = 200  # per line trace at the current zoom (see app_covid.decimate)
 
 
 class Production(Config):
     DEV = False
 
+    CACHE_CONFIG = dict(
+        Config.CACHE_CONFIG, CACHE_TYPE=environ.get("CACHE_TYPE", "FileSystemCache")
+    )
+
     DEV_HYLODE = False
     # Use the IP address b/c slow on DNS resolution
     # e.g. HYLODE_ICU_LIVE = 'http://uclvlddpragae08:5006/icu/live/T06/ui'
     # sitrep data
-    HYLODE_ICU_LIVE = "http://172.16.149.205:5006/icu/live/{ward}/ui"
+    HYLODE_ICU_LIVE = environ.get("HYLODE_ICU_LIVE", "http://172.16.149.205:5006/icu/live/{ward}/ui")
     # census data
-    HYLODE_EMAP_CENSUS = "http://172.16.149.205:5006/emap/census/{ward}/"
+    HYLODE_EMAP_CENSUS = environ.get("HYLODE_EMAP_CENSUS", "http://172.16.149.205:5006/emap/census/{ward}/")
 
     DEV_USER = True
     USER_DATA_SOURCE = create_engine("sqlite:///data/sitrep.db")
@@ -101,6 +174,8 @@ class Production(Config):
 
 class Development(Config):
     DEV = True
+    # the sample files do not change (and some wards have none)
+    PREFETCH = False
     DEV_HYLODE = True
     HYLODE_ICU_LIVE = "data/icu_{ward}.json"
     HYLODE_EMAP_CENSUS = "data/census_{ward}.json"
@@ -0,0 +1,72 @@
+"""
+Snapshots of the HYLODE feeds
+Keeps the frame last built from each feed along with a digest of the payload
+so that a refresh that returns the same payload is neither parsed nor rebuilt
+
+NB: patching only the changed records into the previous frame was slower than
+rebuilding it (hashing each record costs more than pd.DataFrame.from_records)
+and the patched frame drifted from a full build in its dtypes and row order
+"""
+import hashlib
+import json
+import logging
+import threading
+
+import pandas as pd
+
+
+def _to_frame(records: list, dtype: dict = None) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(records)
+    for k, v in (dtype or {}).items():
+        if k in df.columns:
+            df[k] = df[k].astype(v)
+    return df
+
+
+class SnapshotStore:
+    """
+    Holds the last frame built from each feed (e.g. one per ward and API)
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def apply(self, name: str, payload: bytes, dtype: dict = None) -> pd.DataFrame:
+        """
+        Returns the frame for the payload
+        rebuilding it only if the payload differs from the last one for the feed
+
+        :param      name:     identifies the feed (e.g. the url)
+        :param      payload:  the response body or file contents; JSON holding
+                              the records either as a list or under 'data'
+        :param      dtype:    enforces datatypes
+
+        :returns:   a copy of the frame (so callers may modify it)
+        """
+        digest = hashlib.sha1(payload).hexdigest()
+        with self._lock:
+            prev = self._snapshots.get(name)
+        if prev is not None and prev["digest"] == digest:
+            logging.info(f"--- {name}: unchanged")
+            return prev["df"].copy()
+
+        records = json.loads(payload)
+        if isinstance(records, dict):
+            records = records["data"]
+        df = _to_frame(records, dtype)
+        with self._lock:
+            self._snapshots[name] = dict(df=df, digest=digest)
+        logging.info(f"--- {name}: rebuilt {len(df)} rows")
+        return df.copy()
+
+    def reset(self, name: str = None):
+        """Forgets the snapshot (or all snapshots) so the next load is in full"""
+        with self._lock:
+            if name is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(name, None)
+
+
+SNAPSHOTS = SnapshotStore()
@@ -0,0 +1,65 @@
+"""
+Server side store for the frames behind dcc.Store components
+The browser holds only a version key; callbacks resolve the key here
+rather than shipping the whole frame back and forth as JSON
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import metrics
+from cache import shared_backend
+from config import ConfigFactory
+
+conf = ConfigFactory.factory()
+
+
+def frame_version(df: pd.DataFrame) -> str:
+    """Content hash of the frame; identical frames get the same version"""
+    h = pd.util.hash_pandas_object(df, index=True).values
+    cols = ",".join(map(str, df.columns)).encode()
+    return hashlib.sha1(h.tobytes() + cols).hexdigest()[:16]
+
+
+class FrameStore:
+    """
+    Least recently used store of frames keyed by version
+
+    If a backend (e.g. a Flask-Caching Cache) is given, frames are kept there
+    instead so that any worker process can resolve a version key
+    """
+
+    def __init__(self, maxsize: int, backend=None):
+        self.maxsize = maxsize
+        self.backend = backend
+        self._store = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, df: pd.DataFrame) -> str:
+        """Stores the frame and returns its version key"""
+        version = frame_version(df)
+        metrics.sample_frame("frame_store", df)
+        if self.backend is not None:
+            self.backend.set(f"frame:{version}", df)
+            return version
+        with self._lock:
+            self._store[version] = df
+            self._store.move_to_end(version)
+            while len(self._store) > self.maxsize:
+                self._store.popitem(last=False)
+        return version
+
+    def get(self, version: str):
+        """Returns the frame for the version or None if unknown (or evicted)"""
+        if self.backend is not None:
+            return self.backend.get(f"frame:{version}")
+        with self._lock:
+            df = self._store.get(version)
+            if df is not None:
+                self._store.move_to_end(version)
+        return df
+
+
+FRAMES = FrameStore(maxsize=conf.FRAME_STORE_SIZE, backend=shared_backend())
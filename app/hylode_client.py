@@ -0,0 +1,110 @@
+"""
+Shared HTTP clients for the HYLODE API (and gov.uk, see wrangle_govuk.py)
+Pools keep-alive connections, sets timeouts, retries with backoff
+and records the latency of each endpoint
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import ConfigFactory
+
+conf = ConfigFactory.factory()
+
+
+class HttpClient:
+    """
+    Thin wrapper around a requests.Session
+
+    One instance per API is shared by the app so that calls to the same host
+    reuse the same TCP connections rather than opening a new one each time
+    """
+
+    HEADERS = {"Accept-Encoding": "gzip, deflate"}
+
+    def __init__(
+        self,
+        timeout: tuple = (3.05, 10),
+        retries: int = 2,
+        backoff_factor: float = 0.5,
+        pool_maxsize: int = 10,
+        latency_window: int = 100,
+    ):
+        """
+        :param      timeout:         (connect, read) timeouts in seconds
+        :param      retries:         retries on connection errors and 5xx responses
+        :param      backoff_factor:  as per urllib3 Retry; sleeps 0, 2x, 4x ... between retries
+        :param      pool_maxsize:    keep-alive connections held per host
+        :param      latency_window:  number of recent calls kept per endpoint
+        """
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(self.HEADERS)
+        self._latency = defaultdict(lambda: deque(maxlen=latency_window))
+        self._lock = threading.Lock()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET the url; raises requests.HTTPError unless the response is OK"""
+        r = self._request("GET", url, **kwargs)
+        r.raise_for_status()
+        return r
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        """HEAD the url; the status code is left for the caller to check"""
+        return self._request("HEAD", url, **kwargs)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            endpoint = urlsplit(url).path
+            with self._lock:
+                self._latency[endpoint].append(elapsed)
+            logging.info(f"--- {method} {endpoint} took {elapsed:.3f}s")
+
+    def latency(self) -> dict:
+        """
+        Summarises the recent latency of each endpoint
+
+        :returns:   dict of endpoint: dict(n, mean, max, last) in seconds
+        """
+        with self._lock:
+            return {
+                k: dict(n=len(v), mean=sum(v) / len(v), max=max(v), last=v[-1])
+                for k, v in self._latency.items()
+                if v
+            }
+
+
+class HylodeClient(HttpClient):
+    """HttpClient for the HYLODE API which only serves JSON"""
+
+    HEADERS = {**HttpClient.HEADERS, "Accept": "application/json"}
+
+
+HYLODE = HylodeClient(
+    timeout=conf.HYLODE_TIMEOUT,
+    retries=conf.HYLODE_RETRIES,
+    backoff_factor=conf.HYLODE_BACKOFF,
+    pool_maxsize=conf.HYLODE_POOL_SIZE,
+)
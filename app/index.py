@@ -2,24 +2,105 @@
 Principle application file
 https://dash.plotly.com/urls
 """
+import importlib
 import logging
+import threading
+import time
+
+import flask
+import metrics
 from config import ConfigFactory
 from dash import Input, Output, dcc, html
-from app_sitrep import sitrep
-from app_debug import debug
-from app_covid import covid
-from app_ed import ed
-from landing import landing
 
 from app import app
 
-logging.basicConfig(filename='app.log', filemode='w', format='%(name)s - %(levelname)s - %(message)s')
-logging.basicConfig(level=logging.DEBUG)
+# for gunicorn (see gunicorn.conf.py)
+server = app.server
+
+# NB: only the first call to basicConfig has any effect
+logging.basicConfig(
+    filename='app.log',
+    filemode='w',
+    format='%(asctime)s %(name)s - %(levelname)s - %(message)s',
+    level=logging.DEBUG,
+)
 logging.info('--- Application starting')
 
 # configurable configuration
 conf = ConfigFactory.factory()
 
+# pathname: (module, layout)
+# where layout is either a component or a function that builds one
+# Modules are imported at start up so that their callbacks are registered
+# before the browser asks for them, but importing must stay cheap: any data
+# behind a page is fetched when the page (or its callbacks) is first requested
+PAGES = {
+    "/": ("landing", "landing"),
+    "/sitrep": ("app_sitrep", "sitrep"),
+    "/covid": ("app_covid", "covid"),
+    "/ed": ("app_ed", "ed"),
+    "/debug": ("app_debug", "debug_layout"),
+}
+
+STARTUP_TIMES = {}
+BUILD_TIMES = {}
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def import_pages() -> dict:
+    """
+    Imports the page modules and reports how long each took
+
+    :returns:   the modules keyed by name
+    """
+    modules = {}
+    for module, _ in PAGES.values():
+        start = time.perf_counter()
+        modules[module] = importlib.import_module(module)
+        STARTUP_TIMES[module] = round(time.perf_counter() - start, 3)
+
+    print("--- start up time by module")
+    for module, seconds in STARTUP_TIMES.items():
+        print(f"{module:>12} {seconds:>8.3f}s")
+    logging.info(f"--- start up time by module {STARTUP_TIMES}")
+    return modules
+
+
+MODULES = import_pages()
+
+
+def get_page(pathname: str):
+    """
+    Returns the layout for the page building it on the first request
+
+    :param      pathname:  The pathname
+    """
+    if pathname not in _layouts:
+        module, attr = PAGES[pathname]
+        # held while building so that concurrent first requests build once
+        with _layouts_lock:
+            if pathname not in _layouts:
+                start = time.perf_counter()
+                layout = getattr(MODULES[module], attr)
+                _layouts[pathname] = layout() if callable(layout) else layout
+                BUILD_TIMES[pathname] = round(time.perf_counter() - start, 3)
+                logging.info(f"--- built {pathname} in {BUILD_TIMES[pathname]}s")
+    return _layouts[pathname]
+
+
+@server.route("/status/startup")
+def startup_status():
+    """Import time per module and first build time per page (seconds)"""
+    return flask.jsonify(modules=STARTUP_TIMES, pages=BUILD_TIMES)
+
+
+@server.route("/metrics")
+def metrics_endpoint():
+    """Stage timings and frame sizes for this worker (Prometheus text format)"""
+    return flask.Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 app.layout = html.Div(
     [dcc.Location(id="url", refresh=False), html.Div(id="page-content")]
 )
@@ -27,17 +108,9 @@ app.layout = html.Div(
 
 @app.callback(Output("page-content", "children"), Input("url", "pathname"))
 def display_page(pathname):
-    if pathname == "/sitrep":
-        return sitrep
-    elif pathname == "/covid":
-        return covid
-    elif pathname == "/ed":
-        return ed
-    elif pathname == "/debug":
-        return debug
-    elif pathname == "/":
-        # Landing page will be served at the basic
-        return landing
+    if pathname in PAGES:
+        # Landing page will be served at the basic "/"
+        return get_page(pathname)
     else:
         # TODO return both the code and the page
         return "404"
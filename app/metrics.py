@@ -0,0 +1,130 @@
+"""
+In process instrumentation
+Timing spans around the stages of the sitrep pipeline and sampled sizes of the
+frames behind dcc.Store components, kept as histograms and served at /metrics
+(see index.py) in the Prometheus text format
+
+NB: each worker process keeps (and reports) its own figures
+"""
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+
+from config import ConfigFactory
+
+conf = ConfigFactory.factory()
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = tuple(2**i for i in range(10, 31, 2))  # 1 KiB to 1 GiB
+
+
+class Histogram:
+    """
+    Counts of observations by bucket (upper bound, inclusive) per set of labels
+    """
+
+    def __init__(self, name: str, help: str, buckets: tuple):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = dict(counts=[0] * (len(self.buckets) + 1), sum=0.0)
+            s["counts"][i] += 1
+            s["sum"] += value
+
+    def summary(self) -> dict:
+        """count, sum and mean per set of labels (as a 'k=v,...' string)"""
+        with self._lock:
+            return {
+                ",".join(f"{k}={v}" for k, v in key): dict(
+                    count=sum(s["counts"]),
+                    sum=s["sum"],
+                    mean=s["sum"] / max(sum(s["counts"]), 1),
+                )
+                for key, s in self._series.items()
+            }
+
+    def render(self) -> list:
+        """Lines in the Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: dict(counts=list(s["counts"]), sum=s["sum"]) for k, s in self._series.items()}
+        for key, s in sorted(series.items()):
+            labels = [f'{k}="{v}"' for k, v in key]
+            cumulative = 0
+            for le, n in zip(self.buckets + ("+Inf",), s["counts"]):
+                cumulative += n
+                bucket = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket}}} {cumulative}")
+            lbl = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{self.name}_sum{lbl} {s['sum']}")
+            lines.append(f"{self.name}_count{lbl} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "sitrep_stage_seconds", "Time spent in each stage of the sitrep pipeline", SECONDS_BUCKETS
+)
+FRAME_BYTES = Histogram(
+    "sitrep_frame_bytes", "Memory (deep) of sampled frames by where they are held", BYTES_BUCKETS
+)
+FRAME_ROWS = Histogram(
+    "sitrep_frame_rows", "Rows of sampled frames by where they are held", (10, 50, 100, 500, 1000, 5000, 10000)
+)
+REGISTRY = [STAGE_SECONDS, FRAME_BYTES, FRAME_ROWS]
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """Times the block into STAGE_SECONDS"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage, **labels)
+        logging.debug(f"--- {stage} {labels or ''} took {elapsed:.3f}s")
+
+
+def timed(stage: str):
+    """Decorator; times each call of the function as the named stage"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def sample_frame(store: str, df: pd.DataFrame, rate: float = None):
+    """
+    Records the size of the frame for a random fraction (rate) of calls
+    as memory_usage(deep=True) is not free on wide object columns
+    """
+    if df is None or random.random() >= (conf.METRICS_FRAME_SAMPLE if rate is None else rate):
+        return
+    FRAME_BYTES.observe(int(df.memory_usage(deep=True).sum()), store=store)
+    FRAME_ROWS.observe(len(df), store=store)
+
+
+def render() -> str:
+    """All the histograms in the Prometheus text format"""
+    return "\n".join(line for h in REGISTRY for line in h.render()) + "\n"
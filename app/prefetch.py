@@ -0,0 +1,150 @@
+"""
+Background prefetch of ward data
+Refreshes every configured ward on a fixed cadence so that switching wards
+is served from warm data rather than waiting on the source systems
+"""
+import fcntl
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import arrow
+
+
+class Prefetcher:
+    """
+    Schedules refresh(ward) for each ward every interval seconds
+    on a bounded pool of workers
+
+    Each ward's next run is jittered so that wards do not all hit the source
+    systems at once, and backs off exponentially while a ward keeps failing
+    """
+
+    def __init__(
+        self,
+        wards: list,
+        refresh,
+        interval: float,
+        workers: int = 2,
+        jitter: float = 0.1,
+        max_backoff: float = 15 * 60,
+        backend=None,
+    ):
+        """
+        :param      wards:        wards to keep warm
+        :param      refresh:      callable taking a ward; publishes its data to the cache
+        :param      interval:     seconds between refreshes of a ward
+        :param      workers:      maximum concurrent refreshes
+        :param      jitter:       +/- fraction of interval added to each run
+        :param      max_backoff:  longest wait in seconds after repeated failures
+        :param      backend:      shared cache (get, set) to publish the status to
+                                  so that any worker process can report it
+        """
+        self.wards = [w.lower() for w in wards]
+        self.refresh = refresh
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._running = set()
+        # stagger the first runs
+        now = time.monotonic()
+        self._due = {w: now + random.uniform(0, jitter * interval) for w in self.wards}
+        self._status = {
+            w: dict(last_refresh=None, duration=None, failures=0, last_error=None)
+            for w in self.wards
+        }
+
+    def start(self, lock_path=None):
+        """
+        Starts the scheduler in a daemon thread
+
+        :param      lock_path:  if given the scheduler only runs while this process
+                                holds an exclusive lock on the file, so that only one
+                                of several worker processes prefetches; another takes
+                                over if that process exits
+        """
+        threading.Thread(
+            target=self._run, args=(lock_path,), name="prefetch-scheduler", daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._executor.shutdown(wait=False)
+
+    def status(self) -> dict:
+        """Last refresh time, duration (seconds), failures and next run for each ward"""
+        if self.backend is not None:
+            return self.backend.get("prefetch:status") or {}
+        return self._local_status()
+
+    def _local_status(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                w: dict(
+                    **s,
+                    running=w in self._running,
+                    next_in=round(max(self._due[w] - now, 0), 1),
+                )
+                for w, s in self._status.items()
+            }
+
+    def _run(self, lock_path=None):
+        if lock_path is not None:
+            lock_path.parent.mkdir(parents=True, exist_ok=True)
+            # held (never closed) for the life of the process
+            self._lock_file = open(lock_path, "a")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            logging.info(f"--- prefetching in this process (holds {lock_path})")
+        while not self._stop.is_set():
+            now = time.monotonic()
+            with self._lock:
+                due = [w for w, t in self._due.items() if t <= now and w not in self._running]
+                self._running.update(due)
+                waits = [t - now for w, t in self._due.items() if w not in self._running]
+            for ward in due:
+                self._executor.submit(self._refresh, ward)
+            self._wake.wait(timeout=max(min(waits, default=self.interval), 0.1))
+            self._wake.clear()
+
+    def _refresh(self, ward: str):
+        start = time.perf_counter()
+        try:
+            self.refresh(ward)
+        except Exception as e:
+            logging.exception(f"--- prefetch of {ward} failed")
+            with self._lock:
+                s = self._status[ward]
+                s["failures"] += 1
+                s["last_error"] = repr(e)
+                wait = min(self.interval * 2 ** s["failures"], self.max_backoff)
+                self._finish(ward, wait)
+            return
+        duration = time.perf_counter() - start
+        logging.info(f"--- prefetched {ward} in {duration:.3f}s")
+        with self._lock:
+            self._status[ward].update(
+                last_refresh=str(arrow.now()),
+                duration=round(duration, 3),
+                failures=0,
+                last_error=None,
+            )
+            self._finish(ward, self.interval)
+
+    def _finish(self, ward: str, wait: float):
+        # called with the lock held
+        wait += random.uniform(-self.jitter, self.jitter) * wait
+        self._due[ward] = time.monotonic() + wait
+        self._running.discard(ward)
+        self._wake.set()
+        if self.backend is not None:
+            self.backend.set("prefetch:status", self._local_status())
@@ -0,0 +1,95 @@
+"""
+Registry of ward skeletons (the beds on each ward)
+Loads and validates the skeleton file once, keeps a frame per ward,
+and reloads when the file changes
+"""
+import logging
+import threading
+import warnings
+from pathlib import Path
+
+import pandas as pd
+
+SKELETON_COLS = ["ward_code", "bed_code", "team", "bay", "bed"]
+
+
+def build_skeletons(df: pd.DataFrame, now: pd.Timestamp = None) -> dict:
+    """
+    Validates the skeleton and splits it by ward
+
+    :param      df:   skeleton with ward_code, bed_code, team, valid_to
+    :param      now:  beds with a valid_to before this are dropped
+
+    :returns:   dict of lowercase ward: dataframe indexed by bed_code
+    :raises     ValueError: if a bed appears more than once on a ward
+    """
+    now = pd.Timestamp.now() if now is None else now
+    # keep only those rows where valid_to is missing or in the future
+    valid_to = pd.to_datetime(df["valid_to"])
+    df = df.loc[valid_to.isna() | (valid_to > now)].drop(columns="valid_to")
+
+    dups = df.duplicated(["ward_code", "bed_code"], keep=False)
+    if dups.any():
+        beds = (df.loc[dups, "ward_code"] + ":" + df.loc[dups, "bed_code"]).unique()
+        raise ValueError(f"duplicate beds in skeleton: {', '.join(beds)}")
+
+    # extract bay and bed number from bed_code once here rather than per request
+    dt = df["bed_code"].str.split("-", n=1, expand=True)
+    df = df.assign(bay=dt[0], bed=dt[1])
+
+    return {
+        ward.lower(): dfw.set_index("bed_code", drop=False).rename_axis(None)
+        for ward, dfw in df.groupby("ward_code")
+    }
+
+
+class SkeletonRegistry:
+    """Holds the pre-built skeletons for one file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._mtime = None
+        self._wards = {}
+        self._lock = threading.Lock()
+
+    def get(self, ward: str) -> pd.DataFrame:
+        """
+        Returns the skeleton for the ward (empty if the ward is unknown)
+        reloading first if the file has changed
+        """
+        self._reload_if_changed()
+        df = self._wards.get(ward.lower())
+        if df is None:
+            return pd.DataFrame(columns=SKELETON_COLS)
+        return df.copy()
+
+    def _reload_if_changed(self):
+        mtime = self.path.stat().st_mtime
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                wards = build_skeletons(pd.read_csv(self.path))
+            except Exception:
+                if self._mtime is None:
+                    raise
+                # keep serving the last good version
+                logging.exception(f"--- failed to reload {self.path}")
+                return
+            warnings.warn("***FIXME: need to properly implement a database of ward structures")
+            logging.info(f"--- loaded skeletons for {len(wards)} wards from {self.path}")
+            self._wards = wards
+            self._mtime = mtime
+
+
+_REGISTRIES = {}
+
+
+def get_registry(path) -> SkeletonRegistry:
+    """One registry per skeleton file"""
+    path = Path(path)
+    if path not in _REGISTRIES:
+        _REGISTRIES[path] = SkeletonRegistry(path)
+    return _REGISTRIES[path]
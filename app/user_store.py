@@ -0,0 +1,180 @@
+"""
+Storage layer for user edits (the sitrep_edits table)
+See utils/setup_sitrep_db.py for the schema and indexes
+
+Filtering by ward and recency is pushed down into SQL so that load time
+does not grow with the history of edits; superseded edits are moved to
+an archive table by a background compaction job
+"""
+import fcntl
+import logging
+import threading
+
+import pandas as pd
+import sqlalchemy as sa
+
+# columns as per the SitRepEdits model
+EDIT_COLS = ["ward_code", "mrn", "compared_at", "data_source", "variable", "value"]
+# natural key of an edit; has a unique index (see utils/setup_sitrep_db.py)
+EDIT_KEY = ["ward_code", "mrn", "variable", "compared_at", "data_source"]
+
+
+def enable_wal(engine):
+    """
+    Puts SQLite into write-ahead logging mode on each new connection
+    so that saving edits does not block readers
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @sa.event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+def write_edits(df: pd.DataFrame, table: str, engine) -> int:
+    """
+    Appends user edits in a single transaction
+    Re-saving an edit with the same natural key updates its value in place
+
+    :param      df:      long dataframe of edits as per utils.tbl_compare
+    :param      table:   The table holding the edits
+    :param      engine:  The sqlalchemy engine
+
+    :returns:   number of rows written
+    """
+    dfn = df[EDIT_COLS].copy()
+    dfn["compared_at"] = pd.to_datetime(dfn["compared_at"])
+    dfn = dfn.astype(object).where(dfn.notna(), None)
+    records = dfn.to_dict("records")
+    if not records:
+        return 0
+
+    cols = ", ".join(EDIT_COLS)
+    values = ", ".join(f":{c}" for c in EDIT_COLS)
+    query = sa.text(
+        f"""
+        INSERT INTO {table} ({cols}) VALUES ({values})
+        ON CONFLICT ({", ".join(EDIT_KEY)}) DO UPDATE SET value = excluded.value
+        """
+    ).bindparams(sa.bindparam("compared_at", type_=sa.DateTime))
+    try:
+        with engine.begin() as conn:
+            # executemany; one round trip and one commit for the whole save
+            conn.execute(query, records)
+    except sa.exc.OperationalError as e:
+        # the unique index is missing until utils/setup_sitrep_db.py is re-run
+        if "ON CONFLICT" not in str(e):
+            raise
+        logging.warning(f"--- no unique index on {table}; appending without upsert")
+        query = sa.text(f"INSERT INTO {table} ({cols}) VALUES ({values})").bindparams(
+            sa.bindparam("compared_at", type_=sa.DateTime)
+        )
+        with engine.begin() as conn:
+            conn.execute(query, records)
+    return len(records)
+
+
+def read_latest_edits(
+    table: str, engine, ward, recency_hours: float
+) -> pd.DataFrame:
+    """
+    Returns the most recent user edit of each variable for each patient on the ward
+
+    :param      table:          The table holding the edits
+    :param      engine:         The sqlalchemy engine
+    :param      ward:           The ward or a list of wards (read in one query)
+    :param      recency_hours:  ignore edits older than this
+
+    :returns:   pandas dataframe with one row per (ward_code, mrn, variable)
+    :rtype:     pd.DataFrame
+    """
+    cols = ", ".join(f"e.{c}" for c in EDIT_COLS)
+    query = sa.text(
+        f"""
+        SELECT {cols}
+        FROM {table} e
+        JOIN (
+            SELECT ward_code, mrn, variable, MAX(compared_at) AS compared_at
+            FROM {table}
+            WHERE ward_code IN :wards AND data_source = 'new' AND compared_at > :since
+            GROUP BY ward_code, mrn, variable
+        ) latest
+        ON e.ward_code = latest.ward_code
+            AND e.mrn = latest.mrn
+            AND e.variable = latest.variable
+            AND e.compared_at = latest.compared_at
+        WHERE e.data_source = 'new'
+        """
+    ).bindparams(sa.bindparam("wards", expanding=True))
+    wards = [ward] if isinstance(ward, str) else list(ward)
+    since = pd.Timestamp.now() - pd.Timedelta(hours=recency_hours)
+    with engine.connect() as conn:
+        df = pd.read_sql(
+            query,
+            conn,
+            params=dict(wards=[w.upper() for w in wards], since=since.to_pydatetime()),
+            parse_dates=["compared_at"],
+        )
+    # ties on compared_at are possible if the same edit is saved twice
+    return df.drop_duplicates(["ward_code", "mrn", "variable"], keep="last")
+
+
+def compact_edits(table: str, engine, archive: str) -> int:
+    """
+    Moves superseded edits (those with a later edit of the same variable
+    for the same patient) into the archive table
+
+    :returns:   number of rows archived
+    """
+    cols = ", ".join(EDIT_COLS)
+    superseded = f"""
+        EXISTS (
+            SELECT 1 FROM {table} later
+            WHERE later.ward_code = {table}.ward_code
+                AND later.mrn = {table}.mrn
+                AND later.variable = {table}.variable
+                AND later.data_source = {table}.data_source
+                AND later.compared_at > {table}.compared_at
+        )
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            sa.text(
+                f"INSERT INTO {archive} ({cols}) SELECT {cols} FROM {table} WHERE {superseded}"
+            )
+        )
+        n = conn.execute(sa.text(f"DELETE FROM {table} WHERE {superseded}")).rowcount
+    logging.info(f"--- archived {n} superseded rows from {table} to {archive}")
+    return n
+
+
+def start_compaction(
+    table: str, engine, archive: str, interval: float, lock_path=None
+) -> threading.Event:
+    """
+    Runs compact_edits every interval seconds in a daemon thread
+
+    :param      lock_path:  if given only the process holding an exclusive lock
+                            on this file compacts (see Prefetcher.start)
+    :returns:   an Event; set it to stop the job
+    """
+    stop = threading.Event()
+
+    def run():
+        if lock_path is not None:
+            lock_path.parent.mkdir(parents=True, exist_ok=True)
+            # held (never closed) for the life of the thread
+            lock_file = open(lock_path, "a")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        while not stop.wait(interval):
+            try:
+                compact_edits(table, engine, archive)
+            except Exception:
+                logging.exception(f"--- compaction of {table} failed")
+
+    threading.Thread(target=run, name=f"compact-{table}", daemon=True).start()
+    return stop
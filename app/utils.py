@@ -1,4 +1,5 @@
 import collections
+import numpy as np
 import pandas as pd
 
 
@@ -67,4 +68,100 @@ def tbl_compare(df_old: pd.DataFrame, df_new: pd.DataFrame, cols2save: list, idx
 
     return dfr
 
-  
\ No newline at end of file
+  
+
+def _same_value(a, b) -> bool:
+    if pd.isna(a) or pd.isna(b):
+        return pd.isna(a) and pd.isna(b)
+    return a == b
+
+
+def cells_to_edits(df_base: pd.DataFrame, df_current: pd.DataFrame, cells: dict, cols2save: list, idx=['ward_code', 'mrn']):
+    """
+    Turn the cells edited in the table into a long dataframe of edits
+    (as per tbl_compare) without comparing whole frames
+
+    An edit conflicts if, since the table was built, the bed now holds a
+    different patient or the edited value itself has changed upstream;
+    conflicting edits are not returned as edits
+    NB: only as fresh as df_current (e.g. the server side cache)
+
+    :param      df_base:     frame the table was built from; indexed by row id
+    :param      df_current:  frame as it is now; indexed by row id
+    :param      cells:       {row id: {column: {orig: value, value: value}}}
+                             as tracked by the browser
+    :param      cols2save:   columns whose edits are saved
+    :param      idx:         columns identifying the patient
+
+    :returns:   (edits, conflicts) where conflicts is a list of dicts
+    """
+    compared_at = pd.Timestamp.now()
+    rows = []
+    conflicts = []
+    for row_id, edited in cells.items():
+        if row_id not in df_base.index:
+            continue
+        base = df_base.loc[row_id]
+        # empty beds have no patient to attach an edit to
+        if any(pd.isna(base[i]) for i in idx):
+            continue
+        cur = df_current.loc[row_id] if row_id in df_current.index else None
+        for var, cell in edited.items():
+            if var not in cols2save:
+                continue
+            if (
+                cur is None
+                or not all(_same_value(cur[i], base[i]) for i in idx)
+                or not _same_value(cur[var], base[var])
+            ):
+                conflicts.append(dict(
+                    id=row_id,
+                    variable=var,
+                    orig=base[var],
+                    current=None if cur is None else cur[var],
+                    value=cell['value'],
+                ))
+                continue
+            keys = {i: base[i] for i in idx}
+            value = None if cell['value'] == '' else cell['value']
+            rows.append(dict(**keys, compared_at=compared_at, data_source='new', variable=var, value=value))
+            rows.append(dict(**keys, compared_at=compared_at, data_source='old', variable=var, value=base[var]))
+
+    dfr = pd.DataFrame(rows, columns=idx + ['compared_at', 'data_source', 'variable', 'value'])
+    return dfr, conflicts
+
+
+def lttb(x, y, n: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling
+    Returns the positions of n points (always the first and last) that keep
+    the visual shape of the line y against x
+    via https://skemman.is/handle/1946/15343 (Steinarsson 2013)
+
+    x : numeric and increasing (e.g. DatetimeIndex.asi8)
+    y : values (NaN treated as 0 for the selection only)
+    n : points wanted
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+
+    # n - 2 buckets between the first and last points
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    idx = np.empty(n, dtype=int)
+    idx[0], idx[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # the point chosen makes the largest triangle with the last chosen point
+        # and the average of the next bucket
+        nhi = edges[i + 2] if i + 2 < n - 1 else size
+        avg_x, avg_y = x[hi:nhi].mean(), y[hi:nhi].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
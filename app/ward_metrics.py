@@ -0,0 +1,151 @@
+"""
+Aggregate metrics for a ward (the 'Ward aggregate details' card on the sitrep page)
+Occupancy, ventilation mix, WIM-P, discharge readiness and length of stay
+
+Each ward's aggregates are kept between refreshes and only updated when the
+version of the ward's frame changes, and then only by the beds that changed:
+the old contribution of a changed bed is taken off the counts and the new
+one added. The frame itself is only resolved when the version is new.
+
+NB: held in process; each worker keeps its own
+"""
+import threading
+from collections import Counter
+
+import pandas as pd
+import wrangle as wng
+from config import ConfigFactory
+
+import metrics
+
+conf = ConfigFactory.factory()
+
+FACT_COLS = ["occupied", "vent", "wim", "discharge", "los"]
+
+
+def bed_facts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The values for each bed that the aggregates are built from
+    Everything but occupied is blank for an empty bed
+
+    :param      df:   as per wrangle.wrangle_data (indexed by row id)
+    """
+    occupied = ~df["bed_empty"].fillna(True).astype(bool)
+    vent = df["vent_type_1_4h"].fillna("Unknown")
+    vent = vent.map(wng.VENTILATOR_ACRONYMS).fillna(vent)
+    return pd.DataFrame(
+        dict(
+            occupied=occupied,
+            vent=vent.where(occupied),
+            wim=pd.to_numeric(df["wim_1"], errors="coerce").where(occupied),
+            discharge=df["discharge_ready_1_4h"].where(occupied),
+            los=pd.to_numeric(df["elapsed_los_td"], errors="coerce").where(occupied),
+        ),
+        index=df.index,
+    )
+
+
+def count_facts(facts: pd.DataFrame) -> Counter:
+    """Counts keyed by (metric, value) plus beds, occupied and wim_sum"""
+    c = Counter(beds=len(facts), occupied=int(facts["occupied"].sum()))
+    c["wim_sum"] = float(facts["wim"].sum())
+    for metric in ["vent", "wim", "discharge"]:
+        for value, n in facts[metric].dropna().value_counts().items():
+            c[(metric, value)] += int(n)
+    return c
+
+
+class WardAggregate:
+    """Running aggregates for one ward"""
+
+    def __init__(self):
+        self.version = None
+        self.facts = pd.DataFrame(columns=FACT_COLS)
+        self.hashes = pd.Series(dtype="uint64")
+        self.counts = Counter()
+        self.los = {}
+        self.lock = threading.Lock()
+
+    def update(self, version: str, df: pd.DataFrame) -> int:
+        """
+        Brings the aggregates up to the version
+
+        :returns:   the number of beds that changed
+        """
+        facts = bed_facts(df)
+        # row hashes include the row id so a patient moving bed counts as a change
+        hashes = pd.util.hash_pandas_object(facts, index=True)
+        gone = self.facts.loc[~self.hashes.isin(hashes).to_numpy()]
+        new = facts.loc[~hashes.isin(self.hashes).to_numpy()]
+
+        self.counts.subtract(count_facts(gone))
+        self.counts.update(count_facts(new))
+        # quantiles do not update incrementally but are cheap on a ward's beds
+        los = facts["los"].dropna()
+        self.los = {q: los.quantile(q) for q in conf.LOS_QUANTILES} if len(los) else {}
+
+        self.version, self.facts, self.hashes = version, facts, hashes
+        return max(len(gone), len(new))
+
+    def summary(self) -> dict:
+        c = self.counts
+        beds, occupied = c["beds"], c["occupied"]
+
+        def by(metric, order=()):
+            values = {k[1]: n for k, n in c.items() if isinstance(k, tuple) and k[0] == metric and n > 0}
+            rank = {v: i for i, v in enumerate(order)}
+            return dict(sorted(values.items(), key=lambda kv: (rank.get(kv[0], len(rank)), str(kv[0]))))
+
+        return dict(
+            version=self.version,
+            beds=beds,
+            occupied=occupied,
+            empty=beds - occupied,
+            occupancy=occupied / beds if beds else None,
+            vent=by("vent", wng.VENTILATOR_ACRONYMS.values()),
+            wim_sum=c["wim_sum"],
+            wim=by("wim"),
+            discharge=by("discharge", ["Ready", "Review", "No"]),
+            discharge_ready=c[("discharge", "Ready")],
+            los=dict(self.los),
+        )
+
+
+class WardMetrics:
+    """
+    Aggregates per ward, updated only when the ward's frame version changes
+    """
+
+    def __init__(self):
+        self._wards = {}
+        self._lock = threading.Lock()
+
+    def get(self, ward: str, version: str, frame) -> dict:
+        """
+        Returns the aggregates for the ward at the version
+
+        :param      ward:     The ward
+        :param      version:  version key of the ward's frame (see frame_store.py)
+        :param      frame:    callable taking no arguments that returns the frame
+                              only called if the version is not the one held
+        """
+        ward = ward.lower()
+        with self._lock:
+            agg = self._wards.setdefault(ward, WardAggregate())
+        with agg.lock:
+            if agg.version != version:
+                with metrics.span("ward_metrics", ward=ward):
+                    changed = agg.update(version, frame())
+                print(f"***INFO: ward metrics for {ward} updated by {changed} beds")
+            return agg.summary()
+
+    def reset(self, ward: str = None):
+        """Forgets the ward (or all wards)"""
+        with self._lock:
+            if ward is None:
+                self._wards.clear()
+            else:
+                self._wards.pop(ward.lower(), None)
+
+
+WARD_METRICS = WardMetrics()
@@ -3,16 +3,26 @@ Data management for the app
 Factored out here to make the flow of the code in the app easier to follow
 """
 import json
-import warnings
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from pathlib import Path
 
 import arrow
 import numpy as np
 import pandas as pd
 import requests
 
+import metrics
+import skeleton
+import user_store
 import utils
 
+from cache import WARD_CACHE
 from config import ConfigFactory
+from delta import SNAPSHOTS
+from hylode_client import HYLODE
 
 conf = ConfigFactory.factory()
 
@@ -31,6 +41,7 @@ def prep_cols_for_table(df, cols):
     return list_of_cols
 
 
+@metrics.timed("gen_hylode_url")
 def gen_hylode_url(url, ward):
     ward = ward.upper()
     if url == "sitrep":
@@ -46,6 +57,7 @@ def gen_hylode_url(url, ward):
     return res
 
 
+@metrics.timed("get_hylode_data")
 def get_hylode_data(file_or_url: str, dtype: dict = conf.COLS_DTYPE, dev: bool = False) -> pd.DataFrame:
     """
     Reads a data.
@@ -59,8 +71,7 @@ def get_hylode_data(file_or_url: str, dtype: dict = conf.COLS_DTYPE, dev: bool =
     :rtype:     pandas dataframe
     """
     if not dev:
-        r = requests.get(file_or_url)
-        assert r.status_code == 200
+        r = HYLODE.get(file_or_url)
         df = pd.DataFrame.from_dict(r.json()["data"])
     else:
         df = pd.read_json(file_or_url)
@@ -69,104 +80,273 @@ def get_hylode_data(file_or_url: str, dtype: dict = conf.COLS_DTYPE, dev: bool =
     return df
 
 
+@metrics.timed("get_hylode_snapshot")
+def get_hylode_snapshot(
+    file_or_url: str, dtype: dict = conf.COLS_DTYPE, dev: bool = False, name: str = None
+):
+    """
+    As per get_hylode_data but keeps the frame built for each file_or_url
+    and only parses and rebuilds it when the payload has changed (see delta.py)
+
+    :param      file_or_url:  The file or url
+    :param      dtype:  enforces datatypes
+    :param      dev:    if True works on a file else uses requests and the API
+    :param      name:   the snapshot key if not file_or_url
+                        (so that different loads of the same feed are kept apart)
+
+    :returns:   pandas dataframe
+    """
+    if not dev:
+        payload = HYLODE.get(file_or_url).content
+    else:
+        payload = Path(file_or_url).read_bytes()
+    return SNAPSHOTS.apply(name or file_or_url, payload, dtype)
+
+
+def get_hylode_fingerprint(file_or_url: str, dev: bool = False):
+    """
+    Returns a token that changes when the upstream data changes
+    without downloading the data itself
+
+    :param      file_or_url:  The file or url
+    :param      dev:    if True works on a file else uses requests and the API
+
+    :returns:   file mtime if dev else the ETag or Last-Modified header;
+                None if the source does not say
+    """
+    if dev:
+        return Path(file_or_url).stat().st_mtime
+    try:
+        r = HYLODE.head(file_or_url)
+    except requests.RequestException:
+        return None
+    if r.status_code != 200:
+        return None
+    return r.headers.get("ETag") or r.headers.get("Last-Modified")
+
+
+# shared pool so that concurrent loads do not each pay for thread start up
+SOURCE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=2 * len(conf.SOURCE_TIMEOUTS), thread_name_prefix="source"
+)
+
+
+def _timed_call(name: str, func):
+    """Runs func and logs how long it took (as the fetch stage for the named source)"""
+    start = time.perf_counter()
+    with metrics.span("fetch", source=name):
+        res = func()
+    logging.info(f"--- {name} loaded in {time.perf_counter() - start:.3f}s")
+    return res
+
+
+def fetch_sources(
+    sources: dict,
+    timeouts: dict = conf.SOURCE_TIMEOUTS,
+    optional=(),
+    executor: ThreadPoolExecutor = None,
+) -> dict:
+    """
+    Starts all the data sources at once and waits for them to finish
+    so that the load takes as long as the slowest source (not the sum)
+
+    :param      sources:   dict of name: callable taking no arguments
+    :param      timeouts:  dict of name: seconds; measured from the start
+                           of the whole load so that slow sources do not
+                           extend the deadline for the others
+    :param      optional:  names of sources that are None in the result if
+                           they do not load in time (the others raise TimeoutError)
+    :param      executor:  runs the sources; SOURCE_EXECUTOR if None
+
+    :returns:   dict of name: result
+    :rtype:     dict
+    """
+    start = time.perf_counter()
+    executor = executor or SOURCE_EXECUTOR
+    futures = {
+        name: executor.submit(_timed_call, name, func)
+        for name, func in sources.items()
+    }
+    res = {}
+    for name, future in futures.items():
+        remaining = timeouts.get(name, 30) - (time.perf_counter() - start)
+        try:
+            res[name] = future.result(timeout=max(remaining, 0))
+        except FuturesTimeoutError:
+            future.cancel()
+            if name not in optional:
+                raise TimeoutError(
+                    f"{name} did not load within {timeouts.get(name, 30)}s"
+                )
+            logging.warning(f"--- {name} did not load within {timeouts.get(name, 30)}s")
+            res[name] = None
+    logging.info(f"--- all sources loaded in {time.perf_counter() - start:.3f}s")
+    return res
+
+
+# keys used to join sitrep onto census; dev data has fake MRNs so beds only
+BED_KEYS = ["ward_code", "bay_code", "bed_code"]
+CENSUS_KEYS = ["mrn"] + BED_KEYS
+
+
+def index_for_merge(df: pd.DataFrame, dev: bool = False) -> pd.DataFrame:
+    """
+    Indexes sitrep or census data by the merge keys
+    so that it can be reused by merge_census_data across refreshes
+
+    :param      df:   sitrep or census dataframe
+    :param      dev:  as per merge_census_data
+    """
+    keys = BED_KEYS if dev else CENSUS_KEYS
+    return df.set_index(keys).sort_index()
+
+
+@metrics.timed("merge_census_data")
 def merge_census_data(
-    sitrep: pd.DataFrame, census: pd.DataFrame, dev: bool = False
+    sitrep: pd.DataFrame, census: pd.DataFrame, dev: bool = False, counts: dict = None
 ) -> pd.DataFrame:
     """
     Cleans sitrep info to ensure that only patients currently in census are reported
 
-    :param      sitrep:  dataframe containing sitrep info
-    :param      census:  dataframe containing census info
+    Either frame may be passed already indexed by the merge keys
+    (see index_for_merge)
 
-    :returns:   { description_of_the_return_value }
+    :param      sitrep:   dataframe containing sitrep info
+    :param      census:   dataframe containing census info
+    :param      dev:      if True merge on beds only (MRNs won't be in sync)
+    :param      counts:   if given is updated with counts of census beds,
+                          matched beds, beds without sitrep data (unmatched_beds),
+                          beds where sitrep has a different patient (mrn_mismatch)
+                          and sitrep rows dropped
+
+    :returns:   one row per census bed with sitrep data where it matched
     """
+    # WARN?: assumes that mrn does not change *during* the admission
+    keys = BED_KEYS if dev else CENSUS_KEYS
+    if list(census.index.names) != keys:
+        census = census.set_index(keys)
+    if list(sitrep.index.names) != keys:
+        sitrep = sitrep.set_index(keys)
+
+    df = census[[]].merge(
+        sitrep, how="left", left_index=True, right_index=True, indicator=True
+    )
+
+    unmatched = df["_merge"] == "left_only"
     if dev:
-        # MRNs won't be in sycn if dev; just screen on beds
-        census = census[["ward_code", "bay_code", "bed_code"]]
-        df = census.merge(sitrep, how="left")
+        mrn_mismatch = 0
+    else:
+        # unmatched beds that sitrep does report must be reporting someone else
+        beds_in_sitrep = df.index.droplevel("mrn").isin(sitrep.index.droplevel("mrn"))
+        mrn_mismatch = int((unmatched & beds_in_sitrep).sum())
+    res = dict(
+        census_beds=len(df),
+        matched=int((~unmatched).sum()),
+        unmatched_beds=int(unmatched.sum()) - mrn_mismatch,
+        mrn_mismatch=mrn_mismatch,
+        sitrep_dropped=len(sitrep) - int((~unmatched).sum()),
+    )
+    if counts is not None:
+        counts.update(res)
+    if unmatched.any():
+        logging.warning(f"--- merge sitrep onto census left beds without data {res}")
     else:
-        # WARN?: assumes that mrn does not change *during* the admission
-        census = census[["mrn", "ward_code", "bay_code", "bed_code"]]
-        # merge on beds and mrn
-        df = census.merge(sitrep, how="left")
-
-        chk = merge_census_data(sitrep, census, dev=True).csn.isna().sum()
-        if chk:
-            # now check that csn is not missing as a way of warning about non-merges
-            warnings.warn(
-                f"***FIXME: merge sitrep onto census left {chk} beds without data"
-            )
+        logging.info(f"--- merge sitrep onto census {res}")
 
-    return df
+    return df.drop(columns="_merge").reset_index()
 
 
-def get_user_data(table: str, engine, dev: bool = False) -> pd.DataFrame:
+@metrics.timed("get_user_data")
+def get_user_data(
+    table: str,
+    engine,
+    dev: bool = False,
+    ward: str = None,
+    recency_hours: float = conf.USER_EDIT_RECENCY_HOURS,
+) -> pd.DataFrame:
     """
-    Get's user data; stored for now locally as CSV
-    :returns:   pandas dataframe with three cols ward,bed,wim_r
+    Gets user edits from the user edit db
+
+    :param      ward:           if given then only the most recent edit of each
+                                variable for each patient on the ward is returned
+    :param      recency_hours:  ignore edits older than this (only with ward)
+
+    :returns:   pandas dataframe in long form (one row per edit)
     """
-    df = pd.read_sql(table, con=engine, index_col=None)
+    if ward is None:
+        df = pd.read_sql(table, con=engine, index_col=None)
+    else:
+        df = user_store.read_latest_edits(table, engine, ward, recency_hours)
     return df
 
 
+@metrics.timed("get_bed_skeleton")
 def get_bed_skeleton(ward: str, file_or_url: str, dev: bool = False) -> pd.DataFrame:
     """
     Gets the ward skeleton.
-    Uses the valid_from column to drop invalid teams
+    Uses the valid_to column to drop beds that are no longer valid
+    The file is loaded and validated once (and again when it changes)
 
     :param      ward:  The ward
     :type       ward:  str
 
-    :returns:   The ward skeleton.
+    :returns:   The ward skeleton indexed by bed_code including bay and bed
     :rtype:     pd.DataFrame
     """
-    warnings.warn("***FIXME: need to properly implement a database of ward structures")
-    df = pd.read_csv(file_or_url)
-    df = df[df["ward_code"].str.lower() == ward]
-    # keep only those rows where valid_to is missing
-    df[df["valid_to"].isna()]
-    # TODO: check for dups
-    df.drop("valid_to", axis=1, inplace=True)
-    return df
+    return skeleton.get_registry(file_or_url).get(ward)
+
+
+def _cast_like(values: pd.Series, col: pd.Series) -> pd.Series:
+    """
+    Casts the (string) values of a user edit to the dtype of the column they edit
+    """
+    if pd.api.types.is_string_dtype(col):
+        return values.astype(str)
+    elif pd.api.types.is_float_dtype(col):
+        return pd.to_numeric(values).astype(float)
+    elif pd.api.types.is_integer_dtype(col):
+        return pd.to_numeric(values).astype(float).astype(int)
+    elif pd.api.types.is_datetime64_any_dtype(col):
+        return pd.to_datetime(values)
+    else:
+        raise NotImplementedError
+
 
+def apply_user_edits(df, df_user, recency_hours=conf.USER_EDIT_RECENCY_HOURS):
+    """
+    Replays the most recent user edit of each variable for each patient
+    onto the data (which may hold several wards)
 
-def apply_user_edits(df, df_user, recency_hours=12):
+    Edits are pivoted wide (one row per ward and mrn, one column per variable)
+    so that each variable is cast once and applied in a single pass
+    """
     # prepare user data 
     # filter user dataframe to most recent edits for that patient and that ward
-    ward = df['ward_code'][0]
-    dfu = df_user.loc[df_user['data_source'] == 'new',:]
-    dfu = dfu.loc[df_user['ward_code'] == ward,:]
-    # TODO: make this a config setting
-    # drop edits if > 12h old
+    wards = df['ward_code'].dropna().unique()
+    dfu = df_user.loc[(df_user['data_source'] == 'new') & (df_user['ward_code'].isin(wards)), :]
+    # drop edits if > recency_hours old
     dfu = dfu.loc[dfu['compared_at'] > pd.Timestamp.now() - pd.Timedelta(hours=recency_hours), :]
     # keep only the most recent edits for each variable
-    dfu.sort_values(['mrn', 'variable', 'compared_at'], ascending=[True, True, True], inplace=True)
-    dfu.drop_duplicates(keep='last', inplace=True)
-
-    for row in dfu.itertuples(index=False):
-        u_edit = row._asdict()
-        var = u_edit['variable'] 
-        val = u_edit['value']
-        mrn = u_edit['mrn']
-        
+    dfu = dfu.sort_values(['ward_code', 'mrn', 'variable', 'compared_at'])
+    dfu = dfu.drop_duplicates(['ward_code', 'mrn', 'variable'], keep='last')
+    if dfu.empty:
+        return df
+
+    # one row per patient, one column per edited variable
+    wide = dfu.pivot(index=['ward_code', 'mrn'], columns='variable', values='value')
+
+    # position of each row's patient in wide (-1 if no edits)
+    pos = wide.index.get_indexer(pd.MultiIndex.from_frame(df[['ward_code', 'mrn']]))
+    rows = pos >= 0
+    for var in wide.columns:
+        new = pd.Series(wide[var].to_numpy()[pos[rows]], index=df.index[rows]).dropna()
         # convert to appropriate type
-        col_type = df[var]
-        if pd.api.types.is_string_dtype(col_type):
-            val = str(val)
-        elif pd.api.types.is_float_dtype(col_type):
-            val = float(val)
-        elif pd.api.types.is_integer_dtype(col_type):
-            val = int(float(val))
-        elif pd.api.types.is_datetime64_any_dtype(col_type):
-            val = pd.to_datetime(var)
-        else:
-            raise NotImplementedError
-            
-        df.loc[df['mrn'] == mrn, var] = val
+        df.loc[new.index, var] = _cast_like(new, df[var])
 
     return df
 
 
+@metrics.timed("merge_hylode_user_data")
 def merge_hylode_user_data(df_skeleton, df_hylode, df_user) -> pd.DataFrame:
     """
     Merges HYLODE data onto a skeleton for the ward
@@ -196,24 +376,43 @@ def isots_str2fmt(s: str, format="HH:mm DD MMM YY") -> str:
         return arrow.get(s).format(format)
 
 
+def isots_fmt(
+    s: pd.Series, format: str = "%H:%M %d %b %y", tz: str = conf.DISPLAY_TZ
+) -> pd.Series:
+    """
+    Convert a column of ISO formatted timestamps (as strings) to an alternative format
+    Vectorised equivalent of isots_str2fmt; nulls, NaNs and empty strings become ""
+
+    Timestamps are parsed to UTC (so mixed offsets are fine) then shown in tz
+
+    :param      s:       series of ISO formatted timestamps
+    :param      format:  as per strftime
+    :param      tz:      timezone to display the timestamps in
+    """
+    ts = pd.to_datetime(s, errors="coerce", utc=True)
+    return ts.dt.tz_convert(tz).dt.strftime(format).fillna("")
+
+
+@metrics.timed("wrangle_data")
 def wrangle_data(df, cols):
     # TODO: refactor this as it does more than one thing
     # Prep and wrangle
 
     # sort out dates
-    df["admission_dt_str"] = df.loc[:, "admission_dt"].apply(isots_str2fmt)
+    df["admission_dt_str"] = isots_fmt(df["admission_dt"])
 
     # convert LoS to days
     # df['elapsed_los_td'] = pd.to_numeric(df['elapsed_los_td'], errors='coerce')
     df["elapsed_los_td"] = df["elapsed_los_td"] / (60 * 60 * 24)
     df = df.round({"elapsed_los_td": 2})
 
-    # extract bed number from bed_code
-    dt = df["bed_code"].str.split("-", expand=True)
-    dt.columns = ["bay", "bed"]
-    df = pd.concat([df, dt], axis=1)
+    # extract bed number from bed_code (precomputed by the skeleton)
+    if not {"bay", "bed"}.issubset(df.columns):
+        dt = df["bed_code"].str.split("-", expand=True)
+        dt.columns = ["bay", "bed"]
+        df = pd.concat([df, dt], axis=1)
 
-    df.sort_values(by=["bed"], inplace=True)
+    df.sort_values(by=["ward_code", "bed"], inplace=True)
     # drop unused cols
     keep_cols = [i for i in df.columns.to_list() if i in cols.keys()]
     keep_cols.sort(key=lambda x: list(cols.keys()).index(x))
@@ -224,7 +423,11 @@ def wrangle_data(df, cols):
     if "bed_code" not in keep_cols:
         keep_cols[0:0] = ["bed_code"]
     df = df[keep_cols]
-    df["id"] = df["bed_code"]
+    # bed codes are only unique within a ward
+    if df["ward_code"].nunique() > 1:
+        df["id"] = df["ward_code"] + ":" + df["bed_code"]
+    else:
+        df["id"] = df["bed_code"]
     df.set_index("id", inplace=True, drop=False)
 
     return df
@@ -242,25 +445,21 @@ def select_cols(df: pd.DataFrame, keep_cols: list):
     return df[keep_cols]
 
 
-def write_data(df: pd.DataFrame, table: str,  engine, replace: bool =False):
+def write_data(df: pd.DataFrame, table: str, engine):
     """
     Write user edits to user edit db
-    
-    :param      df:           { parameter_description }
-    :type       df:           { type_description }
-    :param      file_or_url:  The file or url
-    :type       file_or_url:  str
+    Appends (or upserts on the natural key) in a single transaction
+    so the cost does not depend on the size of the edit history
+
+    :param      df:      long dataframe of edits as per utils.tbl_compare
+    :param      table:   The table holding the edits
+    :param      engine:  The sqlalchemy engine
     """
     dfn = df.reset_index(drop=True)
-    if replace:
-        # housekeeping drop duplicates to keep the database tidy
-        # dfo = original dfn = new
-        dfo = pd.read_sql(table, con=engine, index_col=None)
-        dfu = pd.concat([dfn,dfo])
-        # TODO: factor out the hard coding of variable names here
-        dfu.sort_values(['mrn', 'variable', 'compared_at'], ascending=[True, True, True], inplace=True)
-        dfu.drop_duplicates(keep='last', inplace=True)
-        dfu.to_sql(table, con=engine, if_exists='replace')
-    else:
-        dfn.to_sql(table, con=engine, index=False, if_exists='append')
+    user_store.write_edits(dfn, table, engine)
+
+    # edits change the wrangled data so drop any cached copy
+    for ward in dfn["ward_code"].unique():
+        WARD_CACHE.invalidate(ward)
+    WARD_CACHE.invalidate(conf.HOSPITAL_KEY)
 
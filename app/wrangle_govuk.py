@@ -1,20 +1,49 @@
+import fcntl
+import functools
+import os
+import shutil
+import threading
 from io import StringIO
+from pathlib import Path
 
 import arrow
 import pandas as pd
-import plotly.express as px
-import requests
+import pyarrow.parquet as pq
+import sqlalchemy as sa
 from config import ConfigFactory
+from hylode_client import HttpClient
 import logging
 
 conf = ConfigFactory.factory()
 
 
 engine = conf.GOV_UK_ENGINE
-YESTERDAY = str(arrow.now().shift(days=-1).format("YYYY-MM-DD"))
-URL_HOSP_CASES = f"https://coronavirus.data.gov.uk/api/v2/data?areaType=nhsTrust&release={YESTERDAY}&metric=hospitalCases&format=json"
+URL_HOSP_CASES = "https://coronavirus.data.gov.uk/api/v2/data?areaType=nhsTrust&release={release}&metric=hospitalCases&format=json"
 URL_CASES_BY_AGE = f"https://api.coronavirus.data.gov.uk/v2/data?areaType=region&areaCode=E12000007&metric=newCasesBySpecimenDateAgeDemographics&format=csv"
 
+
+def gen_url_hosp_cases() -> str:
+    """Hospital cases from yesterday's release; worked out per call not at import"""
+    yesterday = arrow.now().shift(days=-1).format("YYYY-MM-DD")
+    return URL_HOSP_CASES.format(release=yesterday)
+
+
+# table: (function returning the url, format)
+GOV_UK_SOURCES = {
+    "hosp_cases": (gen_url_hosp_cases, "json"),
+    "cases_by_age": (lambda: URL_CASES_BY_AGE, "csv"),
+}
+
+# age bands in the cases by age data that sum other bands
+AGE_AGGREGATES = ["60+", "00_59", "unassigned"]
+
+GOV_UK = HttpClient(
+    timeout=conf.GOV_UK_TIMEOUT,
+    retries=conf.HYLODE_RETRIES,
+    backoff_factor=conf.HYLODE_BACKOFF,
+    pool_maxsize=2,
+)
+
 # GOV UK dictionaries and lists
 
 TRUSTS_LONDON = [
@@ -99,45 +128,224 @@ def prepare_trust_info():
     return df
 
 
-def request_gov_uk(url, table, engine, format='json') -> pd.DataFrame:
+def setup_request_cache(engine):
     """
-    Import COVID information as per the gov.uk API here
-    but checks to see if the same request has already been run
+    Creates the table of validators and check times for each url requested
+    Run by ingest_gov_uk so that pages only ever read it (see store_version)
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            sa.text(
+                """
+                CREATE TABLE IF NOT EXISTS request_cache (
+                    url TEXT PRIMARY KEY,
+                    tbl TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    checked_ts TEXT NOT NULL,
+                    updated_ts TEXT
+                )
+                """
+            )
+        )
+
+
+def request_gov_uk(url, table, engine, format='json', max_age: float = 0) -> bool:
+    """
+    Import COVID information as per the gov.uk API here into the local store
+    Sends the ETag / Last-Modified from the last response for the same url
+    so that an unchanged dataset is not downloaded again
     url: API connection
     table: table to store data in local SQLite
-    conn: connection to local db for storing data and logging requests
+    engine: local db for storing data and logging requests
     format: json or csv
+    max_age: seconds; skip the request if this url was checked more recently
+
+    Returns True if the table was updated
     """
     with engine.connect() as conn:
-        req_df = pd.read_sql('requests_log', conn, parse_dates=['request_ts'])
-        
-        request_exists = True if url in req_df.request.values else False
-        request_max_ts = req_df.loc[req_df.request == URL_CASES_BY_AGE, 'request_ts'].max() 
-        request_recent = True if request_max_ts > arrow.now().shift(days=-1) else False
-        
-        if request_exists and request_recent:
-            logging.info(f'--- using cached data for {table}')
-            # sql call at end of function        
-        else:
-            logging.info(f'--- requesting from gov.uk for {table}')
-            response = requests.get(url)
-            if format == 'json':
-                df = pd.json_normalize(response.json(), record_path="body")
-            elif format == 'csv':
-                df = pd.read_csv(StringIO(response.text))
-            else:
-                raise NotImplementedError
-            df.to_sql(table, conn, if_exists='replace')
-
-            request_log = pd.DataFrame({
-                'request': [url],
-                'table': [table],
-                'request_ts': [str(arrow.now())]
-            })
-            request_log.to_sql('requests_log', conn, if_exists='append')
-            
-        df = pd.read_sql(table, conn, parse_dates=['date'])
-    return df
+        cached = conn.execute(
+            sa.text("SELECT etag, last_modified, checked_ts FROM request_cache WHERE url = :url"),
+            dict(url=url),
+        ).mappings().first()
+    if not has_table(table):
+        # e.g. the store was deleted; the validators no longer describe it
+        cached = None
+
+    if cached and arrow.get(cached["checked_ts"]) > arrow.utcnow().shift(seconds=-max_age):
+        logging.info(f'--- checked gov.uk for {table} recently')
+        return False
+
+    headers = {"Accept": "*/*"}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    logging.info(f'--- requesting from gov.uk for {table}')
+    response = GOV_UK.get(url, headers=headers)
+    now = str(arrow.utcnow())
+
+    if response.status_code == 304:
+        logging.info(f'--- gov.uk data for {table} not modified')
+        with engine.begin() as conn:
+            conn.execute(
+                sa.text("UPDATE request_cache SET checked_ts = :now WHERE url = :url"),
+                dict(now=now, url=url),
+            )
+        return False
+
+    if format == 'json':
+        df = pd.json_normalize(response.json(), record_path="body")
+    elif format == 'csv':
+        df = pd.read_csv(StringIO(response.text))
+    else:
+        raise NotImplementedError
+
+    if not df.empty:
+        store_by_date(df, table)
+    with engine.begin() as conn:
+        conn.execute(
+            sa.text(
+                """
+                INSERT INTO request_cache (url, tbl, etag, last_modified, checked_ts, updated_ts)
+                VALUES (:url, :table, :etag, :last_modified, :now, :updated)
+                ON CONFLICT (url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    checked_ts = excluded.checked_ts,
+                    updated_ts = COALESCE(excluded.updated_ts, request_cache.updated_ts)
+                """
+            ),
+            dict(
+                url=url,
+                table=table,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                now=now,
+                updated=None if df.empty else now,
+            ),
+        )
+        request_log = pd.DataFrame({
+            'request': [url],
+            'table': [table],
+            'request_ts': [str(arrow.now())]
+        })
+        request_log.to_sql('requests_log', conn, if_exists='append')
+    return not df.empty
+
+
+def has_table(table, store=None) -> bool:
+    """True if the table has been written to the local store"""
+    return (Path(store or conf.GOV_UK_STORE) / table).exists()
+
+
+def store_by_date(df, table, store=None):
+    """
+    Writes df to the table's monthly Parquet partitions (month=YYYY-MM/part.parquet)
+    Replaces the rows for each date in df and keeps those for other dates
+    The table is rebuilt if its columns have changed
+    """
+    path = Path(store or conf.GOV_UK_STORE) / table
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"])
+    parts = sorted(path.glob("month=*/part.parquet"))
+    if parts and set(pq.read_schema(parts[0]).names) != set(df.columns):
+        logging.info(f'--- columns of {table} have changed; rebuilding')
+        shutil.rmtree(path)
+
+    for month, new in df.groupby(df["date"].dt.strftime("%Y-%m")):
+        part = path / f"month={month}" / "part.parquet"
+        if part.exists():
+            old = pd.read_parquet(part)
+            new = pd.concat([old[~old["date"].isin(new["date"])], new], ignore_index=True)
+        new = new.sort_values("date", kind="stable")
+        part.parent.mkdir(parents=True, exist_ok=True)
+        # written aside then swapped in so that readers never see a partial file
+        tmp = part.with_suffix(".tmp")
+        new.to_parquet(tmp, engine="pyarrow", index=False)
+        os.replace(tmp, part)
+    logging.info(f'--- stored {len(df)} rows for {df["date"].nunique()} dates in {table}')
+
+
+def read_gov_uk(table, columns=None, since=None, filters=None, store=None) -> pd.DataFrame:
+    """
+    Reads the local copy of a gov.uk table (empty if never ingested)
+    columns: read only these columns
+    since: read only the partitions (and rows) from this date onwards
+    filters: further pyarrow filters pushed down to the files
+        e.g. [("areaCode", "in", ["RRV", "RAP"])]
+    """
+    path = Path(store or conf.GOV_UK_STORE) / table
+    if not path.exists():
+        return pd.DataFrame()
+    filters = list(filters or [])
+    if since is not None:
+        since = pd.Timestamp(since)
+        filters += [("month", ">=", since.strftime("%Y-%m")), ("date", ">=", since)]
+    return pd.read_parquet(path, engine="pyarrow", columns=columns, filters=filters or None)
+
+
+def window_start():
+    """First day of the window of data shown by app_covid"""
+    return arrow.now().shift(days=-conf.GOV_UK_WINDOW_DAYS).format("YYYY-MM-DD")
+
+
+def store_version(table, engine):
+    """When the table was last updated by an ingest (None if never)"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(
+                sa.text("SELECT MAX(updated_ts) FROM request_cache WHERE tbl = :table"),
+                dict(table=table),
+            ).scalar()
+    except sa.exc.OperationalError:
+        # nothing ingested yet so no request_cache table
+        return None
+
+
+def ingest_gov_uk(engine, max_age: float = 0) -> dict:
+    """
+    Requests every table in GOV_UK_SOURCES into the local store
+    creating the request_cache table first if need be
+
+    :returns:   table: True if updated
+    """
+    setup_request_cache(engine)
+    updated = {}
+    for table, (gen_url, format) in GOV_UK_SOURCES.items():
+        try:
+            updated[table] = request_gov_uk(gen_url(), table, engine, format=format, max_age=max_age)
+        except Exception:
+            logging.exception(f'--- ingest of {table} from gov.uk failed')
+            updated[table] = False
+    return updated
+
+
+def start_ingestion(engine, interval: float, lock_path=None) -> threading.Event:
+    """
+    Runs ingest_gov_uk now and then every interval seconds in a daemon thread
+    so that pages only ever read the local store
+
+    :param      lock_path:  if given only the process holding an exclusive lock
+                            on this file ingests (see Prefetcher.start)
+    :returns:   an Event; set it to stop the job
+    """
+    stop = threading.Event()
+
+    def run():
+        if lock_path is not None:
+            lock_path.parent.mkdir(parents=True, exist_ok=True)
+            # held (never closed) for the life of the thread
+            lock_file = open(lock_path, "a")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # skip urls checked within the interval e.g. before a restart
+        ingest_gov_uk(engine, max_age=interval)
+        while not stop.wait(interval):
+            ingest_gov_uk(engine)
+
+    threading.Thread(target=run, name="ingest-gov-uk", daemon=True).start()
+    return stop
 
 
 def clean_hosp_cases(df, TRUST_INFO):
@@ -151,7 +359,7 @@ def clean_hosp_cases(df, TRUST_INFO):
     ]
     df = df.merge(trusts_london, how="inner", on="areaCode")
     df["date"] = pd.to_datetime(df["date"])
-    df.drop(["areaType"], axis=1, inplace=True)
+    df.drop(["areaType"], axis=1, inplace=True, errors="ignore")
     return df
 
 
@@ -161,15 +369,82 @@ def clean_popn_cases(df):
     df : data frame of population cases by age
     """
     df["date"] = pd.to_datetime(df["date"])
-    df.drop(["areaType", "areaCode", "areaType"], axis=1, inplace=True)
+    df.drop(["areaType", "areaCode"], axis=1, inplace=True, errors="ignore")
     return df
 
 
-TRUST_INFO = prepare_trust_info()
-df = request_gov_uk(URL_HOSP_CASES, "hosp_cases", engine)
-df = clean_hosp_cases(df, TRUST_INFO)
-HOSP_CASES = df
+@functools.lru_cache(maxsize=None)
+def get_trust_info() -> pd.DataFrame:
+    """Trust information; read on first use then held for the life of the process"""
+    return prepare_trust_info()
+
+
+def get_hosp_cases() -> pd.DataFrame:
+    """Hospital cases for London trusts from the local store; never waits on gov.uk"""
+    return _hosp_cases(store_version("hosp_cases", engine), window_start())
+
+
+@functools.lru_cache(maxsize=2)
+def _hosp_cases(version, since) -> pd.DataFrame:
+    df = read_gov_uk(
+        "hosp_cases",
+        columns=["areaCode", "date", "hospitalCases"],
+        since=since,
+        filters=[("areaCode", "in", TRUSTS_LONDON)],
+    )
+    if df.empty:
+        return df
+    return clean_hosp_cases(df, get_trust_info())
+
+
+def get_cases_by_age() -> pd.DataFrame:
+    """Population cases by age (London) from the local store; never waits on gov.uk"""
+    return _cases_by_age(store_version("cases_by_age", engine), window_start())
+
+
+@functools.lru_cache(maxsize=2)
+def _cases_by_age(version, since) -> pd.DataFrame:
+    df = read_gov_uk(
+        "cases_by_age",
+        columns=["date", "age", "cases"],
+        since=since,
+        filters=[("age", "not in", AGE_AGGREGATES)],
+    )
+    if df.empty:
+        return df
+    return clean_popn_cases(df)
+
+
+def aggregate_hosp_cases(df) -> dict:
+    """
+    Series plotted on the covid page
+    ncl: hospital cases by date (rows) and NCL trust (columns)
+    london: hospital cases summed by date (rows) and London sector (columns)
+    """
+    ncl = df.loc[df.inNCL01].pivot_table(
+        index="date", columns="shortName", values="hospitalCases", aggfunc="sum"
+    )
+    london = df.pivot_table(
+        index="date", columns="sectorName", values="hospitalCases", aggfunc="sum"
+    )
+    return dict(ncl=ncl, london=london)
+
+
+def aggregate_cases_by_age(df) -> pd.DataFrame:
+    """Cases by date (rows) and age band (columns)"""
+    df = df.loc[~df.age.isin(AGE_AGGREGATES)]
+    return df.pivot_table(index="date", columns="age", values="cases", aggfunc="sum")
+
+
+@functools.lru_cache(maxsize=2)
+def hosp_series(release, since) -> dict:
+    """aggregate_hosp_cases once per release (see store_version); None if no data"""
+    df = _hosp_cases(release, since)
+    return None if df.empty else aggregate_hosp_cases(df)
+
 
-df = request_gov_uk(URL_CASES_BY_AGE, "cases_by_age", engine, format="csv")
-df = clean_popn_cases(df)
-CASES_BY_AGE = df
+@functools.lru_cache(maxsize=2)
+def cases_by_age_series(release, since) -> pd.DataFrame:
+    """aggregate_cases_by_age once per release (see store_version); None if no data"""
+    df = _cases_by_age(release, since)
+    return None if df.empty else aggregate_cases_by_age(df)
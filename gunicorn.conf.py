@@ -0,0 +1,34 @@
+# Production serving of the app with several worker processes
+# run from the project root
+# e.g.
+# ENV=PRODUCTION gunicorn --config gunicorn.conf.py index:server
+#
+# Workers share ward data via the Flask-Caching backend in Config.CACHE_CONFIG
+# (FileSystemCache by default in production); see app/app.py
+# With the per process SimpleCache only one worker is started
+import logging
+import multiprocessing
+import os
+import sys
+
+# app modules import each other as top level modules
+pythonpath = "app"
+sys.path.append("app")
+from config import ConfigFactory  # noqa: E402
+
+conf = ConfigFactory.factory()
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8009")
+workers = int(os.environ.get("WEB_CONCURRENCY", min(2 * multiprocessing.cpu_count() + 1, 8)))
+if conf.CACHE_CONFIG["CACHE_TYPE"] == "SimpleCache" and workers > 1:
+    # each worker would hold its own frames so a save could not find the
+    # version it was edited against (and every worker would fetch HYLODE)
+    logging.warning(
+        f"--- CACHE_TYPE is SimpleCache so starting 1 worker not {workers}; "
+        "set CACHE_TYPE=FileSystemCache (or RedisCache) to run more"
+    )
+    workers = 1
+# callbacks mostly wait on I/O
+threads = int(os.environ.get("GUNICORN_THREADS", 2))
+timeout = 120
+accesslog = "-"
@@ -0,0 +1,58 @@
+"""
+Shared fixtures
+The app modules import each other as top level modules (as under gunicorn)
+so app/ and utils/ go on the path as in the scripts in utils/
+"""
+import sys
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "app"))
+sys.path.append(str(ROOT / "utils"))
+
+from stub_hylode import stub_server  # noqa: E402
+
+
+@pytest.fixture
+def hylode_url(monkeypatch):
+    """
+    Base url of a local stub of the HYLODE API serving the JSON in data/
+    (see utils/stub_hylode.py)
+    """
+    # the stub and the app read data/ relative to the project root
+    monkeypatch.chdir(ROOT)
+    with stub_server() as url:
+        yield url
+
+
+@pytest.fixture
+def hylode_url_no_validators(monkeypatch):
+    """As per hylode_url but the stub sends neither ETag nor Last-Modified"""
+    monkeypatch.chdir(ROOT)
+    with stub_server(etag=False) as url:
+        yield url
+
+
+@pytest.fixture
+def sitrep(hylode_url, monkeypatch, tmp_path):
+    """app_sitrep reading from the stub API with an empty user edits db"""
+    import app_sitrep
+    import setup_sitrep_db
+    from delta import SNAPSHOTS
+
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'sitrep.db'}")
+    setup_sitrep_db.setup(engine)
+    # every module's conf is an instance of the same class
+    Config = type(app_sitrep.conf)
+    monkeypatch.setattr(Config, "DEV_HYLODE", False)
+    monkeypatch.setattr(Config, "HYLODE_ICU_LIVE", f"{hylode_url}/icu/live/{{ward}}/ui")
+    monkeypatch.setattr(Config, "HYLODE_EMAP_CENSUS", f"{hylode_url}/emap/census/{{ward}}/")
+    monkeypatch.setattr(Config, "USER_DATA_SOURCE", engine)
+    app_sitrep.WARD_CACHE.invalidate()
+    SNAPSHOTS.reset()
+    yield app_sitrep
+    app_sitrep.WARD_CACHE.invalidate()
+    SNAPSHOTS.reset()
@@ -0,0 +1,48 @@
+"""
+WardCache refreshes (as run by the prefetcher) against the stub HYLODE API
+"""
+from functools import partial
+
+import pytest
+
+import wrangle as wng
+from cache import WardCache
+
+
+@pytest.fixture
+def no_validators_url(hylode_url_no_validators):
+    return f"{hylode_url_no_validators}/icu/live/T03/ui"
+
+
+def counting_loader(url):
+    calls = []
+
+    def loader():
+        calls.append(url)
+        return wng.get_hylode_data(url)
+
+    return loader, calls
+
+
+def test_refresh_without_validators_reloads_an_old_entry(no_validators_url):
+    fingerprint = partial(wng.get_hylode_fingerprint, no_validators_url)
+    assert fingerprint() is None
+
+    cache = WardCache(ttl=60, maxsize=2)
+    loader, calls = counting_loader(no_validators_url)
+    cache.refresh("T03", loader, fingerprint)
+    # loaded longer ago than unknown_max_age so the prefetch reloads it
+    entry = cache._get_entry("t03")
+    entry["loaded_at"] -= 30
+    cache.refresh("T03", loader, fingerprint, unknown_max_age=15)
+    assert len(calls) == 2
+    assert cache._get_entry("t03")["loaded_at"] > entry["loaded_at"] + 29
+
+
+def test_refresh_without_validators_keeps_a_recent_entry(no_validators_url):
+    fingerprint = partial(wng.get_hylode_fingerprint, no_validators_url)
+    cache = WardCache(ttl=60, maxsize=2)
+    loader, calls = counting_loader(no_validators_url)
+    cache.refresh("T03", loader, fingerprint)
+    cache.refresh("T03", loader, fingerprint, unknown_max_age=15)
+    assert len(calls) == 1
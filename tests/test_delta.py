@@ -0,0 +1,43 @@
+"""
+Snapshots of the HYLODE feeds match a full build of the payload
+"""
+import json
+
+import pandas as pd
+
+import wrangle as wng
+from delta import SnapshotStore
+from synthetic import SyntheticWard
+
+
+def full_build(records: list) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(records)
+    return df.astype(wng.conf.COLS_DTYPE)
+
+
+def test_snapshot_matches_full_build_after_change_to_none(tmp_path):
+    records = SyntheticWard(beds=20, seed=1).sitrep
+    f = tmp_path / "icu_t03.json"
+    f.write_text(json.dumps(records))
+    first = wng.get_hylode_snapshot(str(f), dev=True)
+    pd.testing.assert_frame_equal(first, full_build(records))
+
+    # a numeric field going missing makes the column float in a full build
+    records[3]["wim_1"] = None
+    records[5]["avg_heart_rate_1_24h"] = None
+    records[7]["n_inotropes_1_4h"] = None
+    # and a record moving changes the order
+    records.append(records.pop(0))
+    f.write_text(json.dumps(records))
+    second = wng.get_hylode_snapshot(str(f), dev=True)
+    pd.testing.assert_frame_equal(second, full_build(records))
+
+
+def test_unchanged_payload_returns_a_copy():
+    records = SyntheticWard(beds=10, seed=2).census
+    payload = json.dumps({"data": records}).encode()
+    store = SnapshotStore()
+    first = store.apply("census", payload)
+    first.loc[0, "mrn"] = "changed downstream"
+    second = store.apply("census", payload)
+    pd.testing.assert_frame_equal(second, pd.DataFrame.from_records(records))
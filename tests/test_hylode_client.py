@@ -0,0 +1,63 @@
+"""
+HylodeClient and request_data against the stub HYLODE API
+"""
+import time
+
+import pytest
+import requests
+
+import wrangle as wng
+from hylode_client import HylodeClient
+
+
+def test_get_reuses_connection(hylode_url):
+    client = HylodeClient(pool_maxsize=2)
+    url = f"{hylode_url}/icu/live/T03/ui"
+    for _ in range(3):
+        r = client.get(url)
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert len(r.json()["data"]) > 0
+    assert client.latency()["/icu/live/T03/ui"]["n"] == 3
+    # keep-alive: one connection for all three calls
+    pools = client.session.get_adapter(url).poolmanager.pools
+    assert sum(pools[k].num_connections for k in pools.keys()) == 1
+
+
+def test_get_raises_for_unknown_ward(hylode_url):
+    with pytest.raises(requests.HTTPError):
+        HylodeClient(retries=0).get(f"{hylode_url}/icu/live/XXX/ui")
+
+
+def test_fingerprint_is_stable(hylode_url):
+    url = f"{hylode_url}/emap/census/T03/"
+    token = wng.get_hylode_fingerprint(url)
+    assert token is not None
+    assert token == wng.get_hylode_fingerprint(url)
+
+
+def test_request_data(sitrep):
+    df = sitrep.request_data("T03")
+    skeleton = wng.get_bed_skeleton("T03", sitrep.conf.SKELETON_DATA_SOURCE)
+    assert len(df) == len(skeleton)
+    assert df["mrn"].notna().any()
+
+    # served from the cache within the TTL
+    calls = wng.HYLODE.latency()["/icu/live/T03/ui"]["n"]
+    sitrep.request_data("T03")
+    assert wng.HYLODE.latency()["/icu/live/T03/ui"]["n"] == calls
+
+
+def test_load_hospital_leaves_out_a_ward_that_times_out(sitrep, monkeypatch):
+    Config = type(sitrep.conf)
+    monkeypatch.setattr(Config, "SOURCE_TIMEOUTS", {k: 1 for k in Config.SOURCE_TIMEOUTS})
+    snapshot = wng.get_hylode_snapshot
+
+    def slow_t06(file_or_url, **kwargs):
+        if "T06" in file_or_url:
+            time.sleep(2)
+        return snapshot(file_or_url, **kwargs)
+
+    monkeypatch.setattr(wng, "get_hylode_snapshot", slow_t06)
+    df = sitrep.load_hospital(["T03", "T06"])
+    assert df.attrs["missing"] == ["T06"]
+    assert set(df["ward_code"]) == {"T03"}
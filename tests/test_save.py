@@ -0,0 +1,68 @@
+"""
+Saving edits from the sitrep table (app_sitrep.data_io) against the stub HYLODE API
+"""
+from unittest import mock
+
+import dash
+import pandas as pd
+import pytest
+
+from frame_store import FRAMES
+
+
+def save(sitrep, source, dirty):
+    triggered = mock.Mock(triggered=[{"prop_id": "tbl-save.n_clicks"}])
+    with mock.patch.object(dash, "callback_context", triggered):
+        return sitrep.data_io(source, dirty, "T03", 1, 0, 0)
+
+
+def saved_edits(sitrep) -> pd.DataFrame:
+    return pd.read_sql("SELECT * FROM sitrep_edits", sitrep.conf.USER_DATA_SOURCE)
+
+
+@pytest.fixture
+def loaded(sitrep):
+    """The T03 frame as loaded into the table, its version and an occupied bed"""
+    df = sitrep.request_data("T03")
+    row_id = df.index[df["mrn"].notna()][0]
+    return df, FRAMES.put(df), row_id
+
+
+def test_edit_is_saved(sitrep, loaded):
+    df, version, row_id = loaded
+    dirty = {row_id: {"discharge_ready_1_4h": dict(orig=df.loc[row_id, "discharge_ready_1_4h"], value="Review")}}
+    out = save(sitrep, dict(ward="t03", version=version), dirty)
+    assert out["status"] is None
+    edits = saved_edits(sitrep)
+    assert edits.loc[edits.data_source == "new", "value"].tolist() == ["Review"]
+    assert sitrep.request_data("T03").loc[row_id, "discharge_ready_1_4h"] == "Review"
+
+
+def test_missing_base_frame_is_not_saved(sitrep, loaded):
+    df, version, row_id = loaded
+    dirty = {row_id: {"discharge_ready_1_4h": dict(orig=None, value="Review")}}
+    out = save(sitrep, dict(ward="t03", version="evicted"), dirty)
+    assert out["json_data"] is dash.no_update
+    assert out["status"].color == "danger"
+    assert saved_edits(sitrep).empty
+
+
+def test_changed_base_value_is_not_saved(sitrep, loaded):
+    df, version, row_id = loaded
+    # the table was built from a frame where the value differed from now
+    base = df.copy()
+    base.loc[row_id, "discharge_ready_1_4h"] = "Something else"
+    dirty = {row_id: {"discharge_ready_1_4h": dict(orig="Something else", value="Review")}}
+    out = save(sitrep, dict(ward="t03", version=FRAMES.put(base)), dirty)
+    assert out["status"].color == "warning"
+    assert saved_edits(sitrep).empty
+
+
+def test_changed_patient_is_not_saved(sitrep, loaded):
+    df, version, row_id = loaded
+    base = df.copy()
+    base.loc[row_id, "mrn"] = "00000000"
+    dirty = {row_id: {"discharge_ready_1_4h": dict(orig=df.loc[row_id, "discharge_ready_1_4h"], value="Review")}}
+    out = save(sitrep, dict(ward="t03", version=FRAMES.put(base)), dirty)
+    assert out["status"].color == "warning"
+    assert saved_edits(sitrep).empty
@@ -0,0 +1,117 @@
+"""
+The SQL behind the user edits (user_store.py) on a temporary SQLite database
+"""
+import pandas as pd
+import pytest
+import sqlalchemy as sa
+
+import setup_sitrep_db
+import user_store
+
+TABLE = "sitrep_edits"
+ARCHIVE = setup_sitrep_db.SitRepEditsArchive.__tablename__
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'sitrep.db'}")
+    setup_sitrep_db.setup(engine)
+    yield engine
+    engine.dispose()
+
+
+def edits(rows: list) -> pd.DataFrame:
+    """(ward_code, mrn, variable, value, data_source, hours ago)"""
+    now = pd.Timestamp.now().floor("s")
+    return pd.DataFrame(
+        [
+            dict(ward_code=w, mrn=m, compared_at=now - pd.Timedelta(hours=h), data_source=s, variable=v, value=x)
+            for w, m, v, x, s, h in rows
+        ],
+        columns=user_store.EDIT_COLS,
+    )
+
+
+def read_table(engine, table=TABLE) -> pd.DataFrame:
+    return pd.read_sql(f"SELECT * FROM {table} ORDER BY id", engine)
+
+
+def test_read_latest_edits(engine):
+    user_store.write_edits(
+        edits([
+            ("T03", "111", "wim_1", "3", "new", 3),
+            ("T03", "111", "wim_1", "4", "new", 2),
+            ("T03", "111", "wim_1", "3", "old", 1),
+            ("T03", "111", "discharge_ready_1_4h", "Ready", "new", 2),
+            ("T03", "222", "wim_1", "5", "new", 20),
+            ("T06", "333", "wim_1", "6", "new", 1),
+        ]),
+        TABLE,
+        engine,
+    )
+    df = user_store.read_latest_edits(TABLE, engine, "t03", recency_hours=12)
+    latest = df.set_index(["mrn", "variable"])["value"].to_dict()
+    # the latest 'new' edit per (mrn, variable); older than recency_hours and other wards left out
+    assert latest == {("111", "wim_1"): "4", ("111", "discharge_ready_1_4h"): "Ready"}
+    both = user_store.read_latest_edits(TABLE, engine, ["T03", "T06"], recency_hours=12)
+    assert sorted(both["mrn"]) == ["111", "111", "333"]
+
+
+def test_compact_edits_archives_only_superseded_rows(engine):
+    user_store.write_edits(
+        edits([
+            ("T03", "111", "wim_1", "3", "new", 3),
+            ("T03", "111", "wim_1", "2", "old", 3),
+            ("T03", "111", "wim_1", "4", "new", 2),
+            ("T03", "111", "wim_1", "3", "old", 2),
+            ("T03", "111", "discharge_ready_1_4h", "Ready", "new", 2),
+            ("T03", "222", "wim_1", "5", "new", 1),
+        ]),
+        TABLE,
+        engine,
+    )
+    before = user_store.read_latest_edits(TABLE, engine, "T03", recency_hours=12)
+    assert user_store.compact_edits(TABLE, engine, ARCHIVE) == 2
+
+    archived = read_table(engine, ARCHIVE)
+    assert sorted(zip(archived["data_source"], archived["value"])) == [("new", "3"), ("old", "2")]
+    kept = read_table(engine)
+    assert len(kept) == 4
+    pd.testing.assert_frame_equal(
+        user_store.read_latest_edits(TABLE, engine, "T03", recency_hours=12), before
+    )
+    # nothing left to archive
+    assert user_store.compact_edits(TABLE, engine, ARCHIVE) == 0
+
+
+def test_write_edits_upserts_on_the_natural_key(engine):
+    df = edits([("T03", "111", "wim_1", "3", "new", 1), ("T03", "111", "wim_1", "2", "old", 1)])
+    assert user_store.write_edits(df, TABLE, engine) == 2
+    # the same edit saved again with another value replaces it
+    user_store.write_edits(df.assign(value=["4", "2"]), TABLE, engine)
+    rows = read_table(engine)
+    assert len(rows) == 2
+    assert rows.set_index("data_source")["value"].to_dict() == {"new": "4", "old": "2"}
+
+
+def test_write_edits_appends_without_the_unique_index(engine):
+    with engine.begin() as conn:
+        conn.execute(sa.text("DROP INDEX ux_sitrep_edits_key"))
+    df = edits([("T03", "111", "wim_1", "3", "new", 1)])
+    user_store.write_edits(df, TABLE, engine)
+    user_store.write_edits(df.assign(value="4"), TABLE, engine)
+    assert read_table(engine)["value"].tolist() == ["3", "4"]
+
+
+def test_setup_dedupes_before_creating_the_unique_index(engine):
+    with engine.begin() as conn:
+        conn.execute(sa.text("DROP INDEX ux_sitrep_edits_key"))
+    df = edits([("T03", "111", "wim_1", "3", "new", 1)])
+    user_store.write_edits(df, TABLE, engine)
+    user_store.write_edits(df.assign(value="4"), TABLE, engine)
+
+    setup_sitrep_db.setup(engine)
+    # the last saved duplicate is kept and upserts work again
+    assert read_table(engine)["value"].tolist() == ["4"]
+    user_store.write_edits(df.assign(value="5"), TABLE, engine)
+    assert read_table(engine)["value"].tolist() == ["5"]
@@ -0,0 +1,78 @@
+"""
+Turning the cells edited in the table into edits to save (utils.cells_to_edits)
+"""
+import numpy as np
+import pandas as pd
+
+import utils
+
+COLS2SAVE = ["wim_1", "discharge_ready_1_4h"]
+
+
+def base_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        dict(
+            ward_code=["T03", "T03", "T03"],
+            mrn=["111", "222", np.nan],
+            wim_1=[3.0, 5.0, np.nan],
+            discharge_ready_1_4h=["No", "Ready", None],
+        ),
+        index=pd.Index(["SR01-01", "SR02-02", "SR03-03"], name="id"),
+    )
+
+
+def edit(value, orig=None):
+    return dict(orig=orig, value=value)
+
+
+def test_unchanged_row_is_saved_as_new_and_old():
+    df = base_frame()
+    edits, conflicts = utils.cells_to_edits(df, df.copy(), {"SR01-01": {"wim_1": edit(6, 3.0)}}, COLS2SAVE)
+    assert conflicts == []
+    assert edits[["mrn", "data_source", "variable", "value"]].values.tolist() == [
+        ["111", "new", "wim_1", 6],
+        ["111", "old", "wim_1", 3.0],
+    ]
+
+
+def test_blank_value_is_saved_as_none_and_other_columns_ignored():
+    df = base_frame()
+    cells = {"SR02-02": {"discharge_ready_1_4h": edit("", "Ready"), "name": edit("x")}}
+    edits, conflicts = utils.cells_to_edits(df, df.copy(), cells, COLS2SAVE)
+    assert conflicts == []
+    new = edits.loc[edits.data_source == "new"]
+    assert new["variable"].tolist() == ["discharge_ready_1_4h"]
+    assert new["value"].isna().all()
+
+
+def test_empty_bed_and_unknown_row_are_skipped():
+    df = base_frame()
+    cells = {"SR03-03": {"wim_1": edit(2)}, "SR99-99": {"wim_1": edit(2)}}
+    edits, conflicts = utils.cells_to_edits(df, df.copy(), cells, COLS2SAVE)
+    assert edits.empty and conflicts == []
+
+
+def test_different_patient_in_the_bed_conflicts():
+    df = base_frame()
+    current = df.copy()
+    current.loc["SR01-01", "mrn"] = "333"
+    edits, conflicts = utils.cells_to_edits(df, current, {"SR01-01": {"wim_1": edit(6, 3.0)}}, COLS2SAVE)
+    assert edits.empty
+    assert conflicts == [dict(id="SR01-01", variable="wim_1", orig=3.0, current=3.0, value=6)]
+
+
+def test_changed_base_value_conflicts_only_for_that_cell():
+    df = base_frame()
+    current = df.copy()
+    current.loc["SR01-01", "wim_1"] = 4.0
+    cells = {"SR01-01": {"wim_1": edit(6, 3.0), "discharge_ready_1_4h": edit("Ready", "No")}}
+    edits, conflicts = utils.cells_to_edits(df, current, cells, COLS2SAVE)
+    assert [(c["variable"], c["current"]) for c in conflicts] == [("wim_1", 4.0)]
+    assert set(edits["variable"]) == {"discharge_ready_1_4h"}
+
+
+def test_bed_gone_from_current_conflicts():
+    df = base_frame()
+    edits, conflicts = utils.cells_to_edits(df, df.drop("SR01-01"), {"SR01-01": {"wim_1": edit(6, 3.0)}}, COLS2SAVE)
+    assert edits.empty
+    assert conflicts[0]["current"] is None
@@ -0,0 +1,60 @@
+"""
+Running ward aggregates (ward_metrics.py) match a full recomputation
+"""
+import numpy as np
+import pandas as pd
+
+from ward_metrics import WardAggregate
+
+
+def ward_frame(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    empty = rng.random(n) < 0.2
+    return pd.DataFrame(
+        dict(
+            bed_empty=empty,
+            vent_type_1_4h=rng.choice(["Ventilated (Invasive)", "Room air", None], n),
+            wim_1=rng.choice([1.0, 2.0, 3.0, np.nan], n),
+            discharge_ready_1_4h=rng.choice(["Ready", "Review", "No", None], n),
+            elapsed_los_td=rng.uniform(0, 30, n).round(2),
+        ),
+        index=pd.Index([f"SR{i:02d}-{i:02d}" for i in range(n)], name="id"),
+    )
+
+
+def full(df: pd.DataFrame) -> dict:
+    agg = WardAggregate()
+    agg.update("full", df)
+    return {k: v for k, v in agg.summary().items() if k != "version"}
+
+
+def test_update_matches_full_recomputation():
+    agg = WardAggregate()
+    df = ward_frame(30, seed=1)
+    agg.update("v1", df)
+
+    changed = df.copy()
+    # a patient discharged, one admitted to an empty bed and values changed
+    occupied = changed.index[~changed["bed_empty"]]
+    empty = changed.index[changed["bed_empty"]]
+    changed.loc[occupied[0], ["bed_empty", "vent_type_1_4h", "wim_1", "discharge_ready_1_4h"]] = [True, None, np.nan, None]
+    changed.loc[empty[0], ["bed_empty", "vent_type_1_4h", "wim_1"]] = [False, "Room air", 2.0]
+    changed.loc[occupied[1:4], "wim_1"] = 3.0
+    changed.loc[occupied[4], "discharge_ready_1_4h"] = "Ready"
+    # beds added and removed
+    changed = pd.concat([changed.drop(occupied[5:7]), ward_frame(33, seed=2).iloc[30:]])
+
+    assert agg.update("v2", changed) > 0
+    summary = agg.summary()
+    assert summary.pop("version") == "v2"
+    assert summary == full(changed)
+
+
+def test_update_with_the_same_frame_changes_nothing():
+    agg = WardAggregate()
+    df = ward_frame(20, seed=3)
+    agg.update("v1", df)
+    assert agg.update("v2", df.copy()) == 0
+    summary = agg.summary()
+    summary.pop("version")
+    assert summary == full(df)
@@ -0,0 +1,106 @@
+"""
+Loading and merging the sources in wrangle.py
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import wrangle as wng
+
+
+def test_fetch_sources_optional_timeout_is_none():
+    sources = {"fast": lambda: 1, "slow": lambda: time.sleep(1) or 2}
+    res = wng.fetch_sources(sources, timeouts={"fast": 0.5, "slow": 0.2}, optional=["slow"])
+    assert res == {"fast": 1, "slow": None}
+
+
+def test_fetch_sources_required_timeout_raises():
+    sources = {"fast": lambda: 1, "slow": lambda: time.sleep(1) or 2}
+    with pytest.raises(TimeoutError):
+        wng.fetch_sources(sources, timeouts={"fast": 0.5, "slow": 0.2})
+
+
+def apply_user_edits_loop(df, df_user, recency_hours=12):
+    """The row by row apply_user_edits that the vectorised one replaced"""
+    ward = df["ward_code"].iloc[0]
+    dfu = df_user.loc[(df_user["data_source"] == "new") & (df_user["ward_code"] == ward), :]
+    dfu = dfu.loc[dfu["compared_at"] > pd.Timestamp.now() - pd.Timedelta(hours=recency_hours), :]
+    dfu = dfu.sort_values(["mrn", "variable", "compared_at"])
+    for row in dfu.itertuples(index=False):
+        col = df[row.variable]
+        if pd.api.types.is_string_dtype(col):
+            val = str(row.value)
+        elif pd.api.types.is_float_dtype(col):
+            val = float(row.value)
+        elif pd.api.types.is_integer_dtype(col):
+            val = int(float(row.value))
+        df.loc[df["mrn"] == row.mrn, row.variable] = val
+    return df
+
+
+def hylode_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        dict(
+            ward_code=["T03"] * 4,
+            bed_code=["SR01-01", "SR02-02", "SR03-03", "SR04-04"],
+            mrn=["111", "222", "333", "444"],
+            wim_1=[1.0, 2.0, np.nan, 4.0],
+            n_inotropes_1_4h=[0, 1, 2, 0],
+            discharge_ready_1_4h=["No", None, "Ready", "No"],
+        )
+    )
+
+
+def user_edits(rows: list) -> pd.DataFrame:
+    now = pd.Timestamp.now()
+    return pd.DataFrame(
+        [
+            dict(ward_code=w, mrn=m, variable=v, value=x, data_source=s, compared_at=now - pd.Timedelta(hours=h))
+            for w, m, v, x, s, h in rows
+        ]
+    )
+
+
+def test_apply_user_edits_matches_row_by_row():
+    edits = user_edits([
+        # latest edit wins
+        ("T03", "111", "wim_1", "5", "new", 2),
+        ("T03", "111", "wim_1", "6", "new", 1),
+        ("T03", "111", "wim_1", "1", "old", 1),
+        ("T03", "222", "discharge_ready_1_4h", "Review", "new", 1),
+        ("T03", "333", "wim_1", "3", "new", 1),
+        ("T03", "444", "n_inotropes_1_4h", "2.0", "new", 1),
+        # too old, another ward, a patient not present
+        ("T03", "444", "wim_1", "7", "new", 24),
+        ("T06", "111", "wim_1", "8", "new", 1),
+        ("T03", "999", "wim_1", "9", "new", 1),
+    ])
+    expected = apply_user_edits_loop(hylode_frame(), edits)
+    res = wng.apply_user_edits(hylode_frame(), edits, recency_hours=12)
+    pd.testing.assert_frame_equal(res, expected)
+    assert res["wim_1"].tolist()[:2] == [6.0, 2.0]
+    assert res["n_inotropes_1_4h"].tolist() == [0, 1, 2, 2]
+
+
+def test_apply_user_edits_keeps_dtypes():
+    df = hylode_frame()
+    dtypes = df.dtypes
+    edits = user_edits([
+        ("T03", "111", "wim_1", "5", "new", 1),
+        ("T03", "222", "n_inotropes_1_4h", "3", "new", 1),
+        ("T03", "333", "discharge_ready_1_4h", "No", "new", 1),
+        # a blanked value is not applied
+        ("T03", "444", "wim_1", None, "new", 1),
+        ("T03", "444", "discharge_ready_1_4h", None, "new", 1),
+    ])
+    res = wng.apply_user_edits(df, edits, recency_hours=12)
+    pd.testing.assert_series_equal(res.dtypes, dtypes)
+    assert res.loc[3, "wim_1"] == 4.0
+    assert res.loc[3, "discharge_ready_1_4h"] == "No"
+
+
+def test_apply_user_edits_without_edits_is_unchanged():
+    edits = user_edits([("T06", "111", "wim_1", "8", "new", 1)])
+    pd.testing.assert_frame_equal(wng.apply_user_edits(hylode_frame(), edits), hylode_frame())
@@ -0,0 +1,150 @@
+# Benchmark a cold load of the gov.uk COVID data for the covid page
+# from the Parquet store (wrangle_govuk.read_gov_uk) against SQLite (to_sql / read_sql)
+# using synthetic data shaped like the gov.uk responses
+# run from the project root
+# e.g.
+# python utils/bench_govuk_store.py --days 1000 --trusts 250 --regions 9
+#
+# Each load runs in a fresh process; memory is the increase in peak RSS (Linux only)
+
+import argparse
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+sys.path.append("app")
+import wrangle_govuk as wgu  # noqa: E402
+
+AGES = [f"{i:02d}_{i + 4:02d}" for i in range(0, 90, 5)] + ["90+"] + wgu.AGE_AGGREGATES
+
+
+def make_hosp_cases(days: int, trusts: int) -> pd.DataFrame:
+    """One row per trust per day; the London trusts plus made up others"""
+    codes = wgu.TRUSTS_LONDON + [f"X{i:02d}" for i in range(max(trusts - len(wgu.TRUSTS_LONDON), 0))]
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=days)
+    idx = pd.MultiIndex.from_product([codes, dates], names=["areaCode", "date"])
+    df = idx.to_frame(index=False)
+    df["areaType"] = "nhsTrust"
+    df["areaName"] = "Trust " + df["areaCode"]
+    df["hospitalCases"] = np.random.default_rng(0).integers(0, 200, len(df))
+    df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+    return df
+
+
+def make_cases_by_age(days: int, regions: int) -> pd.DataFrame:
+    """One row per region per age band per day"""
+    codes = [f"E120000{i:02d}" for i in range(1, regions + 1)]
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=days)
+    idx = pd.MultiIndex.from_product([codes, dates, AGES], names=["areaCode", "date", "age"])
+    df = idx.to_frame(index=False)
+    df["areaType"] = "region"
+    df["areaName"] = "Region " + df["areaCode"]
+    rng = np.random.default_rng(1)
+    df["cases"] = rng.integers(0, 500, len(df))
+    df["rollingSum"] = rng.integers(0, 3500, len(df))
+    df["rollingRate"] = rng.random(len(df)) * 1000
+    df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+    return df
+
+
+def load_sqlite(db: str):
+    """As before: read each whole table then filter in pandas"""
+    engine = sa.create_engine(f"sqlite:///{db}")
+    since = pd.Timestamp(wgu.window_start())
+    with engine.connect() as conn:
+        hosp = pd.read_sql("hosp_cases", conn, parse_dates=["date"])
+        age = pd.read_sql("cases_by_age", conn, parse_dates=["date"])
+    hosp = hosp.loc[hosp.areaCode.isin(wgu.TRUSTS_LONDON) & (hosp.date >= since)]
+    age = age.loc[~age.age.isin(wgu.AGE_AGGREGATES) & (age.date >= since)]
+    return hosp, age
+
+
+def load_parquet(store: str):
+    """As get_hosp_cases / get_cases_by_age: only the window, columns and rows needed"""
+    since = wgu.window_start()
+    hosp = wgu.read_gov_uk(
+        "hosp_cases",
+        columns=["areaCode", "date", "hospitalCases"],
+        since=since,
+        filters=[("areaCode", "in", wgu.TRUSTS_LONDON)],
+        store=store,
+    )
+    age = wgu.read_gov_uk(
+        "cases_by_age",
+        columns=["date", "age", "cases"],
+        since=since,
+        filters=[("age", "not in", wgu.AGE_AGGREGATES)],
+        store=store,
+    )
+    return hosp, age
+
+
+def peak_rss_mb() -> float:
+    """
+    High water mark of this process's resident memory
+    NB: not ru_maxrss, which a spawned process inherits from its parent
+    """
+    with open("/proc/self/status") as f:
+        kb = next(line for line in f if line.startswith("VmHWM")).split()[1]
+    return int(kb) / 1024
+
+
+def cold_load(name: str, path: str, queue):
+    load = dict(sqlite=load_sqlite, parquet=load_parquet)[name]
+    rss = peak_rss_mb()
+    start = time.perf_counter()
+    hosp, age = load(path)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_mb() - rss
+    frames = sum(df.memory_usage(deep=True).sum() for df in (hosp, age))
+    queue.put(dict(seconds=elapsed, peak_mb=peak, frames_mb=frames / 2**20, rows=len(hosp) + len(age)))
+
+
+def run(name: str, path: str) -> dict:
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=cold_load, args=(name, path, queue))
+    proc.start()
+    res = queue.get()
+    proc.join()
+    return res
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the gov.uk local store")
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--trusts", type=int, default=250)
+    parser.add_argument("--regions", type=int, default=9)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    hosp = make_hosp_cases(args.days, args.trusts)
+    age = make_cases_by_age(args.days, args.regions)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = str(Path(tmp) / "gov.db")
+        engine = sa.create_engine(f"sqlite:///{db}")
+        with engine.begin() as conn:
+            hosp.to_sql("hosp_cases", conn, if_exists="replace")
+            age.to_sql("cases_by_age", conn, if_exists="replace")
+        wgu.store_by_date(hosp, "hosp_cases", store=tmp)
+        wgu.store_by_date(age, "cases_by_age", store=tmp)
+
+        results = {}
+        for name, path in [("sqlite", db), ("parquet", tmp)]:
+            runs = [run(name, path) for _ in range(args.repeat)]
+            results[name] = min(runs, key=lambda r: r["seconds"])
+
+    s, p = results["sqlite"], results["parquet"]
+    assert s["rows"] == p["rows"], (s["rows"], p["rows"])
+    print(f"{len(hosp) + len(age)} rows stored, {p['rows']} in the window (best of {args.repeat})")
+    print(f"{'':>8} {'load':>10} {'peak RSS':>10} {'frames':>10}")
+    for name, r in results.items():
+        print(f"{name:>8} {1000 * r['seconds']:>8.1f}ms {r['peak_mb']:>8.1f}MB {r['frames_mb']:>8.1f}MB")
+    print(f"parquet is {s['seconds'] / p['seconds']:.1f}x faster using {s['peak_mb'] / max(p['peak_mb'], 0.1):.1f}x less peak memory")
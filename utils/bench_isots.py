@@ -0,0 +1,54 @@
+# Benchmark wrangle.isots_fmt against the per row arrow formatter (isots_str2fmt)
+# using the admission timestamps from the sample icu_*.json files
+# run from the project root
+# e.g.
+# python utils/bench_isots.py --rows 100000
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append("app")
+import wrangle as wng  # noqa: E402
+
+
+def load_timestamps(rows: int) -> pd.Series:
+    """admission_dt from data/icu_*.json plus some blanks, repeated to the required length"""
+    values = []
+    for f in sorted(Path("data").glob("icu_*.json")):
+        with f.open() as fh:
+            values.extend(p["admission_dt"] for p in json.load(fh))
+    values.extend(["", None, np.NaN])
+    reps = -(-rows // len(values))
+    return pd.Series(values * reps, dtype=object)[:rows]
+
+
+def timeit(func, s, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func(s)
+        times.append(time.perf_counter() - start)
+    return min(times), res
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark timestamp formatting")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    s = load_timestamps(args.rows)
+
+    t_arrow, res_arrow = timeit(lambda x: x.apply(wng.isots_str2fmt), s, args.repeat)
+    t_vec, res_vec = timeit(wng.isots_fmt, s, args.repeat)
+    pd.testing.assert_series_equal(res_arrow, res_vec, check_dtype=False)
+
+    print(f"{args.rows} timestamps (best of {args.repeat})")
+    print(f"arrow      : {1000 * t_arrow:.2f} ms")
+    print(f"vectorised : {1000 * t_vec:.2f} ms ({t_arrow / t_vec:.1f}x)")
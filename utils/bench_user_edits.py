@@ -0,0 +1,103 @@
+# Benchmark wrangle.apply_user_edits against the original per-edit loop
+# run from the project root
+# e.g.
+# python utils/bench_user_edits.py --edits 10000 --beds 60
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append("app")
+import wrangle as wng  # noqa: E402
+
+
+def apply_user_edits_loop(df, df_user, recency_hours=12):
+    """The original implementation: one full scan of df per edit"""
+    ward = df['ward_code'][0]
+    dfu = df_user.loc[df_user['data_source'] == 'new', :]
+    dfu = dfu.loc[df_user['ward_code'] == ward, :]
+    dfu = dfu.loc[dfu['compared_at'] > pd.Timestamp.now() - pd.Timedelta(hours=recency_hours), :]
+    dfu = dfu.sort_values(['mrn', 'variable', 'compared_at'], ascending=[True, True, True])
+    dfu = dfu.drop_duplicates(keep='last')
+
+    for row in dfu.itertuples(index=False):
+        u_edit = row._asdict()
+        var = u_edit['variable']
+        val = u_edit['value']
+        mrn = u_edit['mrn']
+
+        col_type = df[var]
+        if pd.api.types.is_string_dtype(col_type):
+            val = str(val)
+        elif pd.api.types.is_float_dtype(col_type):
+            val = float(val)
+        elif pd.api.types.is_integer_dtype(col_type):
+            val = int(float(val))
+        elif pd.api.types.is_datetime64_any_dtype(col_type):
+            val = pd.to_datetime(val)
+        else:
+            raise NotImplementedError
+
+        df.loc[df['mrn'] == mrn, var] = val
+
+    return df
+
+
+def make_ward(beds: int, ward: str = "T03") -> pd.DataFrame:
+    return pd.DataFrame({
+        "ward_code": ward,
+        "bed_code": [f"BY{i // 10:02d}-{i:02d}" for i in range(beds)],
+        "mrn": [str(40000000 + i) for i in range(beds)],
+        "wim_1": np.zeros(beds, dtype=int),
+        "discharge_ready_1_4h": "No",
+    })
+
+
+def make_edits(df: pd.DataFrame, n: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    variable = rng.choice(["wim_1", "discharge_ready_1_4h"], size=n)
+    value = np.where(
+        variable == "wim_1",
+        rng.integers(0, 10, size=n).astype(str),
+        rng.choice(["Ready", "No", "Review"], size=n),
+    )
+    return pd.DataFrame({
+        "ward_code": df["ward_code"][0],
+        "mrn": rng.choice(df["mrn"], size=n),
+        "compared_at": pd.Timestamp.now() - pd.to_timedelta(rng.uniform(0, 11, size=n), unit="h"),
+        "data_source": rng.choice(["new", "old"], size=n),
+        "variable": variable,
+        "value": value,
+    })
+
+
+def timeit(func, df, df_user, repeat):
+    times = []
+    for _ in range(repeat):
+        dfc = df.copy()
+        start = time.perf_counter()
+        res = func(dfc, df_user)
+        times.append(time.perf_counter() - start)
+    return min(times), res
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark apply_user_edits")
+    parser.add_argument("--edits", type=int, default=10000)
+    parser.add_argument("--beds", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = make_ward(args.beds)
+    df_user = make_edits(df, args.edits)
+
+    t_loop, res_loop = timeit(apply_user_edits_loop, df, df_user, args.repeat)
+    t_vec, res_vec = timeit(wng.apply_user_edits, df, df_user, args.repeat)
+    pd.testing.assert_frame_equal(res_loop, res_vec, check_dtype=False)
+
+    print(f"{args.edits} edits over {args.beds} beds (best of {args.repeat})")
+    print(f"loop       : {1000 * t_loop:.2f} ms")
+    print(f"vectorised : {1000 * t_vec:.2f} ms ({t_loop / t_vec:.1f}x)")
@@ -0,0 +1,236 @@
+# Benchmark suite for the functions in wrangle.py and utils.tbl_compare
+# on synthetic wards (see utils/synthetic.py); runs fully offline as every
+# source is read from local files (dev=True)
+# run from the project root
+# e.g.
+# python utils/bench_wrangle.py --beds 30 120 480 --edits 2000 --mismatch 0.1
+#
+# Each run is appended to bench_output/wrangle.jsonl (not tracked) with the git commit
+# so that a later run can be compared against it
+# e.g.
+# python utils/bench_wrangle.py --compare last
+# python utils/bench_wrangle.py --compare 3ec6017 --fail
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append("app")
+sys.path.append("utils")
+import utils  # noqa: E402
+import wrangle as wng  # noqa: E402
+from config import ConfigFactory  # noqa: E402
+from delta import SNAPSHOTS  # noqa: E402
+from synthetic import EDIT_VARIABLES, SyntheticWard  # noqa: E402
+
+conf = ConfigFactory.factory()
+
+# e.g. the merge warns about every mismatched bed
+logging.getLogger().setLevel(logging.ERROR)
+
+COLS2SAVE = list(EDIT_VARIABLES)
+IDX = ["ward_code", "mrn"]
+
+
+def git_commit() -> tuple:
+    """(short sha, True if the tree has uncommitted changes)"""
+    sha = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
+    dirty = bool(
+        subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True
+        ).stdout.strip()
+    )
+    return sha, dirty
+
+
+def edit_cells(df: pd.DataFrame, frac: float, rng) -> pd.DataFrame:
+    """A copy of df with frac of the patients' editable cells changed (as a user would)"""
+    dfn = df.copy()
+    rows = dfn.index[rng.random(len(dfn)) < frac]
+    for var, gen in EDIT_VARIABLES.items():
+        dfn.loc[rows, var] = gen(rng, len(rows)).astype(dfn[var].dtype)
+    return dfn
+
+
+def cases(ward: SyntheticWard, paths: dict) -> dict:
+    """
+    name: (setup, func) in pipeline order
+    setup returns the arguments for func so that copies are not timed
+    """
+    w = ward.ward
+    sitrep = wng.get_hylode_data(str(paths["sitrep"]), dev=True)
+    census = wng.get_hylode_data(str(paths["census"]), dev=True)
+    user = wng.get_user_data("sitrep_edits", paths["engine"], dev=True, ward=w)
+    skel = wng.get_bed_skeleton(w, paths["skeleton"], dev=True)
+    merged = wng.merge_census_data(sitrep, census, dev=False)
+    hylode = wng.merge_hylode_user_data(skel, merged.copy(), user)
+    wrangled = wng.wrangle_data(hylode.copy(), conf.COLS)
+    patients = hylode.loc[hylode.mrn.notna()].reset_index(drop=True)
+    edited = edit_cells(patients, 0.1, np.random.default_rng(0))
+    edits = utils.tbl_compare(patients, edited, COLS2SAVE, idx=IDX)
+
+    # warm the snapshot so that it is measured on an unchanged feed
+    wng.get_hylode_snapshot(str(paths["sitrep"]), dev=True)
+
+    def none():
+        return ()
+
+    def new_edits():
+        # a fresh timestamp so each repeat inserts rather than upserts
+        return (edits.assign(compared_at=pd.Timestamp.now()), "sitrep_edits", paths["engine"])
+
+    return {
+        "gen_hylode_url": (none, partial(wng.gen_hylode_url, "sitrep", w)),
+        "get_hylode_data": (none, partial(wng.get_hylode_data, str(paths["sitrep"]), dev=True)),
+        "get_hylode_snapshot": (none, partial(wng.get_hylode_snapshot, str(paths["sitrep"]), dev=True)),
+        "get_hylode_fingerprint": (none, partial(wng.get_hylode_fingerprint, str(paths["sitrep"]), dev=True)),
+        "fetch_sources": (
+            none,
+            partial(
+                wng.fetch_sources,
+                {
+                    "sitrep": partial(wng.get_hylode_data, str(paths["sitrep"]), dev=True),
+                    "census": partial(wng.get_hylode_data, str(paths["census"]), dev=True),
+                    "user": partial(wng.get_user_data, "sitrep_edits", paths["engine"], dev=True, ward=w),
+                    "skeleton": partial(wng.get_bed_skeleton, w, paths["skeleton"], dev=True),
+                },
+            ),
+        ),
+        "index_for_merge": (none, partial(wng.index_for_merge, census)),
+        "merge_census_data": (none, partial(wng.merge_census_data, sitrep, census, dev=False)),
+        "get_user_data": (none, partial(wng.get_user_data, "sitrep_edits", paths["engine"], dev=True, ward=w)),
+        "get_bed_skeleton": (none, partial(wng.get_bed_skeleton, w, paths["skeleton"], dev=True)),
+        "apply_user_edits": (lambda: (merged.copy(), user), wng.apply_user_edits),
+        "merge_hylode_user_data": (lambda: (skel, merged.copy(), user), wng.merge_hylode_user_data),
+        "isots_fmt": (lambda: (hylode["admission_dt"],), wng.isots_fmt),
+        "isots_str2fmt": (lambda: (hylode["admission_dt"],), lambda s: s.apply(wng.isots_str2fmt)),
+        "wrangle_data": (lambda: (hylode.copy(), conf.COLS), wng.wrangle_data),
+        "select_cols": (lambda: (wrangled, conf.COLS_FULL), wng.select_cols),
+        "write_data": (new_edits, wng.write_data),
+        "tbl_compare": (lambda: (patients, edited, COLS2SAVE, IDX), utils.tbl_compare),
+    }
+
+
+def timeit(setup, func, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return dict(min=min(times), median=statistics.median(times))
+
+
+def run(args) -> dict:
+    results = {}
+    for beds in args.beds:
+        ward = SyntheticWard(
+            beds=beds, mismatch=args.mismatch, edits=args.edits, seed=args.seed
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = ward.write(tmp)
+            SNAPSHOTS.reset()
+            size = f"beds={beds}"
+            results[size] = {
+                name: timeit(setup, func, args.repeat)
+                for name, (setup, func) in cases(ward, paths).items()
+            }
+            paths["engine"].dispose()
+        print(f"--- {size}: {len(ward.census)} in census, {len(ward.sitrep)} in sitrep, {len(ward.edits)} edits")
+    return results
+
+
+def load_runs(path: Path) -> list:
+    if not path.exists():
+        return []
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_run(runs: list, ref: str):
+    """The latest run for the commit (or the latest run of all if ref is 'last')"""
+    if ref == "last":
+        return runs[-1] if runs else None
+    sha = subprocess.run(
+        ["git", "rev-parse", "--short", ref], capture_output=True, text=True
+    ).stdout.strip() or ref
+    matches = [r for r in runs if r["commit"].startswith(sha) or sha.startswith(r["commit"])]
+    return matches[-1] if matches else None
+
+
+def report(results: dict, base: dict = None, threshold: float = 1.25) -> list:
+    """Prints the medians (and the ratio to base); returns the regressions"""
+    regressions = []
+    for size, funcs in results.items():
+        print(f"\n{size}")
+        print(f"{'function':<24} {'median':>10} {'min':>10}" + (f" {'base':>10} {'ratio':>7}" if base else ""))
+        for name, t in funcs.items():
+            line = f"{name:<24} {1000 * t['median']:>8.3f}ms {1000 * t['min']:>8.3f}ms"
+            b = (base or {}).get(size, {}).get(name)
+            if b:
+                ratio = t["median"] / b["median"]
+                flag = ""
+                if ratio >= threshold:
+                    flag = " REGRESSION"
+                    regressions.append((size, name, ratio))
+                line += f" {1000 * b['median']:>8.3f}ms {ratio:>6.2f}x{flag}"
+            print(line)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark wrangle.py on synthetic wards")
+    parser.add_argument("--beds", type=int, nargs="+", default=[30, 120, 480])
+    parser.add_argument("--edits", type=int, default=2000, help="rows of edit history per ward")
+    parser.add_argument("--mismatch", type=float, default=0.1, help="fraction of sitrep rows that disagree with census")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--results", type=Path, default=Path("bench_output/wrangle.jsonl"))
+    parser.add_argument("--compare", type=str, help="git ref (or 'last') of a stored run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25, help="median ratio reported as a regression")
+    parser.add_argument("--fail", action="store_true", help="exit 1 if there are regressions")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    runs = load_runs(args.results)
+    base = find_run(runs, args.compare) if args.compare else None
+    if args.compare and base is None:
+        print(f"***WARNING: no stored run for {args.compare} in {args.results}")
+
+    results = run(args)
+    commit, dirty = git_commit()
+    if base is not None:
+        print(f"\ncompared with {base['commit']}{' (dirty)' if base['dirty'] else ''} run at {base['ts']}")
+    regressions = report(results, base and base["results"], args.threshold)
+
+    if not args.no_save:
+        args.results.parent.mkdir(parents=True, exist_ok=True)
+        record = dict(
+            commit=commit,
+            dirty=dirty,
+            ts=datetime.now().isoformat(timespec="seconds"),
+            python=platform.python_version(),
+            pandas=pd.__version__,
+            args=dict(edits=args.edits, mismatch=args.mismatch, repeat=args.repeat, seed=args.seed),
+            results=results,
+        )
+        with args.results.open("a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"\nsaved to {args.results}")
+
+    if regressions and args.fail:
+        sys.exit(1)
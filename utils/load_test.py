@@ -0,0 +1,172 @@
+# Load test the app under gunicorn with increasing numbers of workers
+# using the sample data and a shared FileSystemCache
+# run from the project root
+# e.g.
+# python utils/load_test.py --workers 1 2 4 --clients 16 --duration 20
+#
+# Each client repeatedly fires the callback that sends a ward's table data
+# (update_datatable_main) for a ward chosen at random
+#
+# By default the app runs as in production against a stub HYLODE API
+# (utils/stub_hylode.py) that adds --upstream-delay to each response, with
+# CACHE_TTL=0 so every request checks upstream for changes. Requests then
+# mostly wait on I/O and throughput scales with workers even on one core.
+# With --upstream-delay 0 the app reads the sample files (ENV=DEVELOPMENT)
+# and requests are CPU bound, so throughput cannot scale past the cores
+
+import argparse
+import copy
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+import sqlalchemy as sa
+
+sys.path.append("utils")
+from stub_hylode import stub_server  # noqa: E402
+
+WARDS = ["t03", "t06", "wms"]
+USER_DB = "data/sitrep.db"
+
+
+def wait_until_up(url: str, timeout: float = 60):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            if requests.get(url, timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+
+def table_callback(base: str) -> dict:
+    """Builds the request for the tbl-main data callback from the app's dependencies"""
+    deps = requests.get(f"{base}/_dash-dependencies").json()
+    dep = [d for d in deps if d["output"].startswith("..tbl-main.data...")][0]
+    outputs = [
+        dict(zip(["id", "property"], o.split(".", 1)))
+        for o in dep["output"].strip(".").split("...")
+    ]
+    return dict(
+        output=dep["output"],
+        outputs=outputs,
+        inputs=[dict(id="source-data", property="data", value=None)],
+        state=[
+            dict(id="tbl-version", property="data", value=None),
+            dict(id="tbl-dirty", property="data", value={}),
+        ],
+        changedPropIds=["source-data.data"],
+    )
+
+
+def client(base: str, payload: dict, stop: threading.Event, counts: list):
+    session = requests.Session()
+    while not stop.is_set():
+        ward = random.choice(WARDS)
+        payload["inputs"][0]["value"] = dict(ward=ward, version="none", refresh=False)
+        r = session.post(f"{base}/_dash-update-component", json=payload, timeout=30)
+        counts.append(r.status_code)
+
+
+def ensure_user_db():
+    """The production config reads user edits from USER_DB; creates the tables if missing"""
+    engine = sa.create_engine(f"sqlite:///{USER_DB}")
+    if not sa.inspect(engine).has_table("sitrep_edits"):
+        import setup_sitrep_db
+
+        setup_sitrep_db.setup(engine)
+
+
+def run(app: str, workers: int, clients: int, duration: float, port: int, upstream: str = None) -> dict:
+    """
+    :param      upstream:  base url of the stub HYLODE API; if None the app
+                           reads the sample files instead
+    """
+    env = dict(
+        os.environ,
+        ENV="DEVELOPMENT",
+        CACHE_TYPE="FileSystemCache",
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+    )
+    if upstream is not None:
+        env.update(
+            ENV="PRODUCTION",
+            HYLODE_ICU_LIVE=f"{upstream}/icu/live/{{ward}}/ui",
+            HYLODE_EMAP_CENSUS=f"{upstream}/emap/census/{{ward}}/",
+            CACHE_TTL="0",
+        )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "--access-logfile", "/dev/null", app],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(f"{base}/_dash-layout")
+        payload = table_callback(base)
+        # warm the shared cache so that every run measures the same work
+        for ward in WARDS:
+            payload["inputs"][0]["value"] = dict(ward=ward, version="none", refresh=False)
+            requests.post(f"{base}/_dash-update-component", json=payload, timeout=60)
+
+        stop = threading.Event()
+        counts = []
+        threads = [
+            threading.Thread(target=client, args=(base, copy.deepcopy(payload), stop, counts))
+            for _ in range(clients)
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(duration)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+    ok = sum(c == 200 for c in counts)
+    return dict(workers=workers, requests=len(counts), errors=len(counts) - ok, rps=ok / elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the app under gunicorn")
+    parser.add_argument("--app", type=str, default="index:server")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8019)
+    parser.add_argument(
+        "--upstream-delay",
+        type=float,
+        default=0.05,
+        help="seconds the stub HYLODE API adds to each response (0 reads the sample files)",
+    )
+    args = parser.parse_args()
+
+    cores = len(os.sched_getaffinity(0))
+    if args.upstream_delay:
+        ensure_user_db()
+        with stub_server(delay=args.upstream_delay) as upstream:
+            results = [
+                run(args.app, n, args.clients, args.duration, args.port, upstream)
+                for n in args.workers
+            ]
+    else:
+        results = [run(args.app, n, args.clients, args.duration, args.port) for n in args.workers]
+        if max(args.workers) > cores:
+            print(f"***WARNING: CPU bound with {cores} core(s); more workers than cores will not scale")
+    base = results[0]["rps"]
+    print(f"{cores} core(s), upstream delay {args.upstream_delay}s")
+    print(f"{'workers':>8} {'requests':>9} {'errors':>7} {'req/s':>8} {'scaling':>8}")
+    for r in results:
+        print(f"{r['workers']:>8} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8.1f} {r['rps'] / base:>7.2f}x")
@@ -1,22 +1,23 @@
+# Prepare the database that holds user edits
+# run from the project root (see make udb-recreate)
+# e.g.
+# python utils/setup_sitrep_db.py
+#
+# Safe to re-run on an existing database: missing tables and indexes are added
+# (after removing any duplicate edits that would block the unique index)
+import argparse
+import sys
+
 import sqlalchemy as sa
 from sqlalchemy.orm import registry
-import argparse
 
-import sys 
-# TODO: this feels ugly; find better way of organising code
-# on the plus side it means that conf needs only be defined in one place
-sys.path.append("..") # relative imports
-sys.path.append(".") # relative imports
-from app.config import ConfigFactory
-conf = ConfigFactory.factory()
+# as per the other scripts in utils; also lets them import the models
+sys.path.append("app")
+from config import ConfigFactory  # noqa: E402
 
-# parse command line args
-parser = argparse.ArgumentParser(description="Prepare database to hold user edits")
-parser.add_argument('--drop_old', help='Drops old table including data (DESTRUCTIVE)', action="store_true")
-args = parser.parse_args()
+conf = ConfigFactory.factory()
 
 # ORM approach
-engine = conf.USER_DATA_SOURCE
 mapper_registry = registry()
 Base = mapper_registry.generate_base()
 
@@ -31,6 +32,74 @@ class SitRepEdits(Base):
     variable = sa.Column(sa.String, nullable=False)
     value = sa.Column(sa.String)   
 
-if args.drop_old:
-    mapper_registry.metadata.drop_all(engine)
-mapper_registry.metadata.create_all(engine)
+    __table_args__ = (
+        # supports 'latest edit per (mrn, variable)' for a ward
+        sa.Index("ix_sitrep_edits_latest", "ward_code", "mrn", "variable", "compared_at"),
+        # natural key; write_edits upserts on this (see app/user_store.py)
+        sa.Index(
+            "ux_sitrep_edits_key",
+            "ward_code", "mrn", "variable", "compared_at", "data_source",
+            unique=True,
+        ),
+    )
+
+
+class SitRepEditsArchive(Base):
+    """Superseded edits moved here by the compaction job (see app/user_store.py)"""
+    __tablename__ = conf.USER_EDITS_ARCHIVE
+    id = sa.Column(sa.Integer, primary_key=True)
+    ward_code = sa.Column(sa.String, nullable=False)
+    mrn = sa.Column(sa.String, nullable=False)
+    compared_at = sa.Column(sa.TIMESTAMP, nullable=False)
+    data_source = sa.Column(sa.String, nullable=False)
+    variable = sa.Column(sa.String, nullable=False)
+    value = sa.Column(sa.String)
+
+
+def dedupe_edits(engine, table: str = SitRepEdits.__tablename__) -> int:
+    """
+    Deletes all but the last saved row (highest id) for each natural key
+    Tables made before the unique index existed may hold duplicates
+    which would stop the index from being created
+
+    :returns:   number of rows deleted
+    """
+    key = ", ".join(["ward_code", "mrn", "variable", "compared_at", "data_source"])
+    with engine.begin() as conn:
+        n = conn.execute(
+            sa.text(
+                f"DELETE FROM {table} WHERE id NOT IN "
+                f"(SELECT MAX(id) FROM {table} GROUP BY {key})"
+            )
+        ).rowcount
+    if n:
+        print(f"--- deleted {n} duplicate rows from {table}")
+    return n
+
+
+def setup(engine, drop_old: bool = False):
+    """
+    Creates the tables and indexes (adding any that are missing)
+    and puts SQLite into write-ahead logging mode
+    """
+    if drop_old:
+        mapper_registry.metadata.drop_all(engine)
+    if engine.dialect.name == "sqlite":
+        # persists in the database file so applies to every later connection
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    mapper_registry.metadata.create_all(engine)
+    dedupe_edits(engine)
+    # create_all skips tables that already exist so add any missing indexes
+    for table in mapper_registry.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+if __name__ == "__main__":
+    # parse command line args
+    parser = argparse.ArgumentParser(description="Prepare database to hold user edits")
+    parser.add_argument('--drop_old', help='Drops old table including data (DESTRUCTIVE)', action="store_true")
+    args = parser.parse_args()
+
+    setup(conf.USER_DATA_SOURCE, drop_old=args.drop_old)
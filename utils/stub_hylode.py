@@ -0,0 +1,150 @@
+# Local stand in for the HYLODE API serving the anonymised JSON in data/
+# so that the HTTP client can be exercised and benchmarked offline
+# run from the project root
+# e.g.
+# python utils/stub_hylode.py --port 5006          # serve until interrupted
+# python utils/stub_hylode.py --bench 200          # benchmark the client
+#
+# stub_server() is a context manager; it backs the hylode_url fixture in tests/conftest.py
+
+import argparse
+import contextlib
+import gzip
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DATA_DIR = Path("data")
+
+# map the HYLODE API paths onto the sample files
+ROUTES = {
+    re.compile(r"^/icu/live/(?P<ward>\w+)/ui/?$"): "icu_{ward}.json",
+    re.compile(r"^/emap/census/(?P<ward>\w+)/?$"): "census_{ward}.json",
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    delay = 0.0  # seconds added to each response to stand in for the real API
+    etag = True  # False to send no validators (so clients cannot tell if data changed)
+
+    def _payload(self):
+        for pattern, template in ROUTES.items():
+            match = pattern.match(self.path)
+            if match:
+                f = DATA_DIR / template.format(ward=match["ward"].lower())
+                if f.exists():
+                    with f.open() as fh:
+                        return json.dumps({"data": json.load(fh)}).encode()
+        return None
+
+    def _respond(self, body_wanted: bool):
+        if self.delay:
+            time.sleep(self.delay)
+        body = self._payload()
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = hashlib.md5(body).hexdigest() if self.etag else None
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if etag:
+            self.send_header("ETag", etag)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body_wanted:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond(body_wanted=True)
+
+    def do_HEAD(self):
+        self._respond(body_wanted=False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def stub_server(host: str = "127.0.0.1", port: int = 0, delay: float = 0.0, etag: bool = True):
+    """
+    Runs the stub in a background thread and yields its base url
+    port=0 picks a free port; delay (seconds) is added to every response
+    etag=False sends no ETag (as an API that cannot say if the data changed)
+    """
+    handler = type("DelayedStubHandler", (StubHandler,), dict(delay=delay, etag=etag))
+    httpd = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{httpd.server_address[1]}"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def bench(n: int, wards: list):
+    """Compares a new connection per request with the pooled client"""
+    import requests
+
+    sys.path.append("app")
+    from hylode_client import HylodeClient
+
+    with stub_server() as base:
+        urls = [
+            f"{base}{path.format(ward=ward)}"
+            for ward in wards
+            for path in ("/icu/live/{ward}/ui", "/emap/census/{ward}/")
+        ]
+
+        start = time.perf_counter()
+        for i in range(n):
+            requests.get(urls[i % len(urls)], timeout=10).json()
+        bare = time.perf_counter() - start
+
+        client = HylodeClient()
+        start = time.perf_counter()
+        for i in range(n):
+            client.get(urls[i % len(urls)]).json()
+        pooled = time.perf_counter() - start
+
+    print(f"requests.get   : {n} calls in {bare:.3f}s ({1000 * bare / n:.2f} ms/call)")
+    print(f"HylodeClient   : {n} calls in {pooled:.3f}s ({1000 * pooled / n:.2f} ms/call)")
+    for endpoint, stats in sorted(client.latency().items()):
+        print(f"  {endpoint:<24} n={stats['n']:<4} mean={1000 * stats['mean']:.2f} ms max={1000 * stats['max']:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub HYLODE API serving data/*.json")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5006)
+    parser.add_argument("--bench", type=int, default=0, help="Benchmark the client with this many calls")
+    parser.add_argument("--wards", type=str, nargs="+", default=["T03", "T06", "WMS"])
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds added to each response")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.bench, args.wards)
+    else:
+        with stub_server(args.host, args.port, args.delay) as url:
+            print(f"Serving data/ at {url} (ctrl-c to stop)")
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
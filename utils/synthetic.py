@@ -0,0 +1,248 @@
+# Synthetic wards for benchmarks (see utils/bench_wrangle.py)
+# Fields follow the same rules as the anonymised samples made by
+# utils/make_anon_icu.py and utils/make_anon_census.py
+# but for any number of beds, any length of edit history
+# and a chosen rate of sitrep / census mismatches
+# Everything is seeded so the same arguments give the same ward
+#
+# e.g. to write a 200 bed ward to data/synthetic
+# python utils/synthetic.py data/synthetic --beds 200 --edits 5000 --mismatch 0.1
+
+import argparse
+import json
+import sys
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+from faker import Faker
+
+sys.path.append("app")
+import setup_sitrep_db  # noqa: E402
+import user_store  # noqa: E402
+
+VENT_TYPES = ["Room air", "Oxygen", "HFNO", "CPAP/NIV", "Ventilated", "Unknown"]
+ETHNICITIES = [["White British"], [None], ["Other Ethnic Group"], ["Not Yet Asked"], ["Not Stated / Unknown"]]
+# variables that users edit on the sitrep page (see app_sitrep.data_io)
+EDIT_VARIABLES = {
+    "wim_1": lambda rng, n: rng.integers(0, 10, size=n).astype(str),
+    "discharge_ready_1_4h": lambda rng, n: rng.choice(["Ready", "No", "Review"], size=n),
+}
+
+
+class SyntheticWard:
+    """
+    One ward's skeleton, census, sitrep and edit history
+
+    :param      beds:       beds on the ward (about 1 in 4 are side rooms)
+    :param      occupancy:  fraction of beds with a patient in census
+    :param      mismatch:   fraction of occupied beds where sitrep disagrees with census;
+                            split evenly between beds missing from sitrep,
+                            beds where sitrep reports a different patient (MRN)
+                            and extra sitrep rows for beds census has as empty
+    :param      edits:      rows of edit history (old and new values)
+    :param      ward:       ward code
+    :param      seed:       seeds numpy and Faker
+    """
+
+    def __init__(
+        self,
+        beds: int = 30,
+        occupancy: float = 0.85,
+        mismatch: float = 0.0,
+        edits: int = 0,
+        ward: str = "T03",
+        seed: int = 42,
+    ):
+        self.ward = ward
+        self.rng = np.random.default_rng(seed)
+        self.fake = Faker("en_GB")
+        self.fake.seed_instance(seed)
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+
+        self.skeleton = self.make_skeleton(beds)
+        occupied = self.rng.random(beds) < occupancy
+        self.census = [self.make_census_record(bed) for bed in self.skeleton.bed_code[occupied]]
+        empty = list(self.skeleton.bed_code[~occupied])
+        self.sitrep = self.make_sitrep(self.census, empty, mismatch)
+        self.edits = self.make_edits(edits)
+
+    def make_skeleton(self, beds: int) -> pd.DataFrame:
+        side_rooms = beds // 4
+        codes = [f"SR{i + 1:02d}-{i + 1:02d}" for i in range(side_rooms)]
+        codes += [f"BY{i // 6 + 1:02d}-{i + side_rooms + 1:02d}" for i in range(beds - side_rooms)]
+        return pd.DataFrame(
+            dict(
+                ward_code=self.ward,
+                bed_code=codes,
+                team=self.rng.choice(["North", "South"], size=beds),
+                valid_to=None,
+            )
+        )
+
+    def make_person(self) -> dict:
+        """Identifiers as per the anonymisers"""
+        sex = self.rng.choice(["F", "M"])
+        first_name = self.fake.first_name_female() if sex == "F" else self.fake.first_name_male()
+        dob = self.fake.date_of_birth(minimum_age=18, maximum_age=100)
+        return dict(
+            csn=self.fake.numerify("10########"),
+            mrn=self.fake.numerify("4#######"),
+            name=f"{first_name} {self.fake.last_name()}",
+            dob=dob.strftime("%Y-%m-%d"),
+            sex=str(sex),
+        )
+
+    def make_census_record(self, bed_code: str) -> dict:
+        admitted = self.now - timedelta(seconds=int(self.rng.integers(3600, 30 * 24 * 3600)))
+        return dict(
+            **self.make_person(),
+            ethnicity=ETHNICITIES[self.rng.integers(len(ETHNICITIES))],
+            postcode=self.fake.postcode(),
+            admission_dt=admitted.isoformat(),
+            discharge_dt=None,
+            bed_code=bed_code,
+            bay_code=bed_code.split("-")[0],
+            bay_type="SideRoom" if bed_code.startswith("SR") else "Regular",
+            ward_code=self.ward,
+        )
+
+    def make_sitrep_record(self, census: dict, slice_id: int) -> dict:
+        admitted = datetime.fromisoformat(census["admission_dt"])
+        dob = date.fromisoformat(census["dob"])
+        rng = self.rng
+        return dict(
+            episode_slice_id=slice_id,
+            csn=census["csn"],
+            admission_dt=census["admission_dt"],
+            elapsed_los_td=int((self.now - admitted).total_seconds()),
+            bed_code=census["bed_code"],
+            bay_code=census["bay_code"],
+            bay_type=census["bay_type"],
+            ward_code=self.ward,
+            mrn=census["mrn"],
+            name=census["name"],
+            dob=census["dob"],
+            admission_age_years=date.today().year - dob.year,
+            sex=census["sex"],
+            is_proned_1_4h=bool(rng.random() < 0.05),
+            discharge_ready_1_4h="No",
+            is_agitated_1_8h=bool(rng.random() < 0.2),
+            n_inotropes_1_4h=int(rng.integers(0, 3)),
+            had_nitric_1_8h=bool(rng.random() < 0.05),
+            had_rrt_1_4h=bool(rng.random() < 0.1),
+            had_trache_1_12h=bool(rng.random() < 0.1),
+            vent_type_1_4h=str(rng.choice(VENT_TYPES)),
+            avg_heart_rate_1_24h=None if rng.random() < 0.05 else round(float(rng.normal(90, 15)), 6),
+            max_temp_1_12h=None if rng.random() < 0.05 else round(float(rng.normal(37.2, 0.6)), 1),
+            avg_resp_rate_1_24h=None if rng.random() < 0.05 else round(float(rng.normal(18, 4)), 1),
+            wim_1=int(rng.integers(0, 10)),
+        )
+
+    def make_sitrep(self, census: list, empty: list, mismatch: float) -> list:
+        n = int(round(mismatch * len(census)))
+        kinds = self.rng.permutation(len(census))
+        missing = set(kinds[: n // 3])
+        other = set(kinds[n // 3 : 2 * n // 3])
+        extra = empty[: n - len(missing) - len(other)]
+
+        records = []
+        slice_id = 100000
+        for i, c in enumerate(census):
+            if i in missing:
+                continue
+            if i in other:
+                # sitrep still has the previous occupant of the bed
+                c = dict(c, **self.make_person())
+            slice_id += int(self.rng.integers(1, 50))
+            records.append(self.make_sitrep_record(c, slice_id))
+        for bed in extra:
+            # sitrep has a patient census has discharged
+            slice_id += int(self.rng.integers(1, 50))
+            records.append(self.make_sitrep_record(self.make_census_record(bed), slice_id))
+        return records
+
+    def make_edits(self, n: int) -> pd.DataFrame:
+        """Pairs of (old, new) rows as written by utils.tbl_compare"""
+        mrns = [c["mrn"] for c in self.census]
+        if not n or not mrns:
+            return pd.DataFrame(columns=user_store.EDIT_COLS)
+        pairs = max(n // 2, 1)
+        rng = self.rng
+        variable = rng.choice(list(EDIT_VARIABLES), size=pairs)
+        new = np.empty(pairs, dtype=object)
+        old = np.empty(pairs, dtype=object)
+        for var, gen in EDIT_VARIABLES.items():
+            mask = variable == var
+            new[mask] = gen(rng, mask.sum())
+            old[mask] = gen(rng, mask.sum())
+        # spread over a day so some fall outside the recency window
+        compared_at = pd.Timestamp.now().floor("s") - pd.to_timedelta(
+            rng.integers(0, 24 * 3600, size=pairs), unit="s"
+        )
+        base = pd.DataFrame(
+            dict(
+                ward_code=self.ward,
+                mrn=rng.choice(mrns, size=pairs),
+                compared_at=compared_at,
+                variable=variable,
+            )
+        )
+        df = pd.concat(
+            [base.assign(data_source="new", value=new), base.assign(data_source="old", value=old)],
+            ignore_index=True,
+        )
+        # the natural key is unique in the table (see utils/setup_sitrep_db.py)
+        df = df.drop_duplicates(user_store.EDIT_KEY)
+        return df[user_store.EDIT_COLS].head(n).reset_index(drop=True)
+
+    def write(self, path) -> dict:
+        """
+        Writes the ward as the app reads it in development
+        icu_{ward}.json, census_{ward}.json, skeleton.csv and sitrep.db (sitrep_edits)
+
+        :returns:   dict of sitrep, census, skeleton paths and the user db engine
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        files = dict(
+            sitrep=path / f"icu_{self.ward.lower()}.json",
+            census=path / f"census_{self.ward.lower()}.json",
+            skeleton=path / "skeleton.csv",
+        )
+        files["sitrep"].write_text(json.dumps(self.sitrep))
+        files["census"].write_text(json.dumps(self.census))
+        self.skeleton.to_csv(files["skeleton"], index=False)
+
+        engine = sa.create_engine(f"sqlite:///{path / 'sitrep.db'}")
+        setup_sitrep_db.setup(engine, drop_old=True)
+        user_store.write_edits(self.edits, "sitrep_edits", engine)
+        return dict(files, engine=engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic ward")
+    parser.add_argument("path", type=str, help="directory to write to")
+    parser.add_argument("--beds", type=int, default=30)
+    parser.add_argument("--occupancy", type=float, default=0.85)
+    parser.add_argument("--mismatch", type=float, default=0.0)
+    parser.add_argument("--edits", type=int, default=0)
+    parser.add_argument("--ward", type=str, default="T03")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ward = SyntheticWard(
+        beds=args.beds,
+        occupancy=args.occupancy,
+        mismatch=args.mismatch,
+        edits=args.edits,
+        ward=args.ward,
+        seed=args.seed,
+    )
+    ward.write(args.path)
+    print(
+        f"{args.ward}: {args.beds} beds, {len(ward.census)} in census, "
+        f"{len(ward.sitrep)} in sitrep, {len(ward.edits)} edits written to {args.path}"
+    )